@@ -0,0 +1,76 @@
+# 🔧 КОНСТАНТЫ ДЛЯ НАСТРОЙКИ
+ROUNDS = 300                     # Повторов каждого варианта
+PER_PAGE = 6                     # Размер страницы ленты (как в /api/product)
+BUYERS_LIMIT = 6                 # Покупателей в списке (как в /api/product/<id>/buyers)
+
+
+
+import json
+import time
+from flask import jsonify
+from web_server import create_app
+from database import db_manager
+from models import Purchase, db
+import serializers
+
+
+def measure(func):
+    """Среднее время одного вызова в миллисекундах"""
+    func()  # прогрев
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - start) * 1000 / ROUNDS
+
+
+def orm_feed():
+    products = db_manager.get_products_paginated(page=1, per_page=PER_PAGE)
+    return jsonify([product.to_dict() for product in products]).get_data()
+
+
+def fast_feed():
+    rows = db_manager.get_feed_rows(page=1, per_page=PER_PAGE)
+    return serializers.dumps([serializers.feed_product(row) for row in rows])
+
+
+def orm_buyers(product_id):
+    buyers = db_manager.get_product_buyers(product_id, limit=BUYERS_LIMIT)
+    return jsonify([buyer.to_dict() for buyer in buyers]).get_data()
+
+
+def fast_buyers(product_id):
+    rows = db_manager.get_product_buyer_rows(product_id, limit=BUYERS_LIMIT)
+    return serializers.dumps([serializers.public_account(row) for row in rows])
+
+
+def run_benchmark():
+    """Сравнивает ORM-путь (to_dict + jsonify) с Core-запросом и serializers.dumps"""
+    app = create_app()
+
+    with app.test_request_context():
+        product_id = db.session.query(Purchase.product_id).group_by(Purchase.product_id) \
+            .order_by(db.func.count().desc()).limit(1).scalar()
+        if product_id is None:
+            print("❌ В базе нет покупок - сначала запустите seed.py")
+            return
+
+        cases = [
+            ("Лента", orm_feed, fast_feed),
+            ("Покупатели", lambda: orm_buyers(product_id), lambda: fast_buyers(product_id)),
+        ]
+
+        print(f"🚀 Сериализация: ORM vs Core ({ROUNDS} повторов, JSON: {'orjson' if serializers.orjson else 'json'})")
+        for title, orm_path, fast_path in cases:
+            # Ответы должны совпадать по содержимому
+            if json.loads(orm_path()) != json.loads(fast_path()):
+                print(f"❌ {title}: ответы различаются!")
+                continue
+
+            orm_ms = measure(orm_path)
+            fast_ms = measure(fast_path)
+            db.session.remove()
+            print(f"   📊 {title}: ORM {orm_ms:.3f} мс, Core {fast_ms:.3f} мс, ускорение x{orm_ms / fast_ms:.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
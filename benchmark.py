@@ -0,0 +1,299 @@
+"""Бенчмарк роутов web_server через Flask test client (в процессе, без сети).
+
+Набор данных генерируется generate_dataset.py в --data-dir (один раз, затем
+переиспользуется). Каждый запуск работает с копией набора во временном
+каталоге: сценарии buy/checkout/upload пишут в базу и uploads, а сравнивать
+коммиты имеет смысл только на одинаковых данных. Для каждого сценария считаются пропускная способность,
+p50/p95/p99 задержки и число SQL-запросов на запрос; результат пишется в JSON,
+чтобы сравнивать коммиты между собой:
+
+    python benchmark.py --requests 500 --concurrency 4 --output bench_data/before.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from PIL import Image
+from sqlalchemy import event, func, select
+
+from models import db, Account, Product, Purchase
+from pagination import encode_cursor
+from tokens import issue_token
+from web_server import create_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Endpoint benchmark with latency percentiles and SQL counts")
+    parser.add_argument('--data-dir', default='bench_data', help="dataset database and uploads")
+    parser.add_argument('--accounts', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--purchases', type=int, default=50000)
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=1, help="worker threads")
+    parser.add_argument('--scenarios', help="comma-separated subset, e.g. feed,buyers")
+    parser.add_argument('--no-response-cache', action='store_true', help="measure without the catalog cache")
+    parser.add_argument('--output', default=os.path.join('bench_data', 'benchmark.json'))
+    return parser.parse_args()
+
+
+def ensure_dataset(args):
+    """Генерирует набор данных, если базы в --data-dir еще нет"""
+    database_path = os.path.abspath(os.path.join(args.data_dir, 'bench.db'))
+    uploads = os.path.abspath(os.path.join(args.data_dir, 'uploads'))
+    if not os.path.exists(database_path):
+        os.makedirs(args.data_dir, exist_ok=True)
+        print("🧪 Генерируем набор данных для бенчмарка...")
+        subprocess.run([
+            sys.executable, 'generate_dataset.py',
+            '--accounts', str(args.accounts), '--products', str(args.products),
+            '--purchases', str(args.purchases), '--images', str(args.images),
+            '--seed', str(args.seed), '--prefix', 'bench',
+            '--database', f"sqlite:///{database_path}", '--uploads', uploads,
+        ], check=True)
+    return database_path, uploads
+
+
+@contextmanager
+def dataset_copy(database_path, uploads):
+    """Временная копия базы и uploads набора данных: (database_path, uploads) копии.
+
+    База копируется через backup API SQLite (с учетом незачекпоинченного WAL),
+    кэш рендишенов не копируется - каждый запуск начинает с холодного.
+    """
+    run_dir = tempfile.mkdtemp(prefix='bench_run_')
+    try:
+        run_database = os.path.join(run_dir, os.path.basename(database_path))
+        source = sqlite3.connect(database_path)
+        target = sqlite3.connect(run_database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        run_uploads = os.path.join(run_dir, 'uploads')
+        shutil.copytree(uploads, run_uploads, ignore=shutil.ignore_patterns('cache'))
+        yield run_database, run_uploads
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+class StatementCounter:
+    """Считает SQL-запросы текущего потока (test client выполняет запрос в том же потоке)"""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, 'count', 0)
+
+
+def upload_image(number: int) -> bytes:
+    """Уникальная небольшая картинка: загрузки не должны схлопываться дедупликацией"""
+    rng = random.Random(number)
+    image = Image.new('RGB', (1200, 900), tuple(rng.randrange(256) for _ in range(3)))
+    image.putpixel((0, 0), (number % 256, number // 256 % 256, number // 65536 % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def build_scenarios(app, args):
+    """Сценарии: имя -> функция (client, rng, number) -> response"""
+    with app.app_context():
+        products = db.session.execute(
+            select(Product.id, Product.photo_url, Product.updated_at).order_by(func.random()).limit(500)
+        ).all()
+        accounts = db.session.execute(select(Account.id).order_by(func.random()).limit(500)).scalars().all()
+        pages = max(1, db.session.execute(select(func.count(Product.id))).scalar() // 6)
+
+    secret, ttl = app.config['SECRET_KEY'], app.config['TOKEN_TTL']
+    tokens = [issue_token(account_id, secret, ttl) for account_id in accounts]
+    cursors = [encode_cursor(row.updated_at, row.id) for row in products]
+    uploads = [upload_image(number) for number in range(args.requests)]
+
+    def auth(rng):
+        return {'Authorization': f"Bearer {rng.choice(tokens)}"}
+
+    def upload(client, rng, number):
+        return client.post('/api/products', content_type='multipart/form-data', data={
+            'image': (io.BytesIO(uploads[number % len(uploads)]), f"bench_{number}.jpg"),
+            'title': f"Bench {number}", 'price': '100', 'creator_id': rng.choice(accounts),
+        })
+
+    return {
+        'health': lambda client, rng, number: client.get('/api/health'),
+        'feed': lambda client, rng, number: client.get(f"/api/product?page={rng.randint(1, pages)}"),
+        'feed_cursor': lambda client, rng, number: client.get(f"/api/product?after={rng.choice(cursors)}"),
+        'buyers': lambda client, rng, number: client.get(f"/api/product/{rng.choice(products).id}/buyers"),
+        'product_detail': lambda client, rng, number: client.get(f"/api/products/{rng.choice(products).id}"),
+        'account': lambda client, rng, number: client.get(f"/api/accounts/{rng.choice(accounts)}"),
+        'profile': lambda client, rng, number: client.get('/api/auth/profile', headers=auth(rng)),
+        'login': lambda client, rng, number: client.post('/api/auth/login', json={
+            'login': f"bench_{rng.randint(1, len(accounts))}", 'password': '123456'}),
+        'buy': lambda client, rng, number: client.post('/api/product/buy', headers=auth(rng), json={
+            'id': rng.choice(products).id}),
+        'checkout': lambda client, rng, number: client.post('/api/product/buy', headers=auth(rng), json={
+            'ids': [row.id for row in rng.sample(products, 5)]}),
+        'upload': upload,
+        'photo': lambda client, rng, number: client.get(f"/photos/{rng.choice(products).id}"),
+        'image_original': lambda client, rng, number: client.get(
+            f"/api/images/original/{rng.choice(products).photo_url}"),
+        'thumbnail': lambda client, rng, number: client.get(
+            f"/api/images/thumbnail/{rng.choice(products).photo_url}"),
+        'thumbnail_w320_webp': lambda client, rng, number: client.get(
+            f"/api/images/thumbnail/{rng.choice(products).photo_url}?w=320", headers={'Accept': 'image/webp'}),
+        'thumbnail_avif': lambda client, rng, number: client.get(
+            f"/api/images/thumbnail/{rng.choice(products).photo_url}", headers={'Accept': 'image/avif'}),
+    }
+
+
+def percentile(sorted_values, fraction: float):
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_scenario(app, counter, scenario, args):
+    latencies = []
+    statements = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker(worker_number):
+        rng = random.Random(f"{args.seed}:{worker_number}")
+        client = app.test_client()
+        for number in range(worker_number, args.requests, args.concurrency):
+            counter.reset()
+            started = time.perf_counter()
+            response = scenario(client, rng, number)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed * 1000)
+                statements.append(counter.count)
+                statuses[response.status_code] += 1
+            response.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / wall, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'sql_per_request': {
+            'mean': round(sum(statements) / len(statements), 2),
+            'max': max(statements),
+        },
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark():
+    args = parse_args()
+    with dataset_copy(*ensure_dataset(args)) as (database_path, uploads):
+        run_benchmark_on(args, database_path, uploads)
+
+
+def run_benchmark_on(args, database_path, uploads):
+    overrides = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}",
+        'UPLOAD_FOLDER': uploads,
+        'RENDITION_CACHE_FOLDER': os.path.join(uploads, 'cache'),
+        'IMAGE_WORKERS': 0,  # Загрузки обрабатываются в запросе - время обработки входит в замер
+    }
+    if args.no_response_cache:
+        overrides['RESPONSE_CACHE_SIZE'] = 0
+    app = create_app(overrides)
+    with app.app_context():
+        counter = StatementCounter(db.engine)
+        # Фактический размер базы (она могла быть сгенерирована с другими параметрами)
+        dataset = {model.__tablename__: db.session.execute(select(func.count()).select_from(model)).scalar()
+                   for model in (Account, Product, Purchase)}
+
+    scenarios = build_scenarios(app, args)
+    if args.scenarios:
+        selected = args.scenarios.split(',')
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            print(f"❌ Неизвестные сценарии: {', '.join(sorted(unknown))}")
+            return
+        scenarios = {name: scenarios[name] for name in selected}
+
+    print(f"📂 Копия набора данных: {os.path.dirname(database_path)}")
+    print(f"🚀 Бенчмарк: {args.requests} запросов на сценарий, потоков: {args.concurrency}")
+    results = {}
+    for name, scenario in scenarios.items():
+        results[name] = run_scenario(app, counter, scenario, args)
+        latency = results[name]['latency_ms']
+        print(f"   📊 {name:20} {results[name]['throughput_rps']:9.1f} req/s  "
+              f"p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  p99 {latency['p99']:8.2f} ms  "
+              f"SQL {results[name]['sql_per_request']['mean']:5.1f}  {results[name]['statuses']}")
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': dataset,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'response_cache': not args.no_response_cache,
+        },
+        'scenarios': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"\n💾 Результаты: {args.output}")
+    with app.app_context():
+        db.engine.dispose()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,170 @@
+"""Проверка планов запросов каталога на большом наборе данных (SQLite).
+
+Для каждой комбинации ?sort= / ?creator= / min_price / max_price (и курсорных
+страниц), поиска, профиля и покупателей строит EXPLAIN QUERY PLAN и
+падает с кодом 1, если запрос читает таблицу целиком или сортирует выборку
+во временном B-дереве (USE TEMP B-TREE) вместо чтения в порядке индекса:
+
+    python check_query_plans.py --products 200000 --purchases 500000
+
+Набор данных общий с benchmark.py (--data-dir, генерируется один раз). Те же
+запросы проверяет tests/test_query_plans.py.
+"""
+import argparse
+import itertools
+import re
+import sys
+import time
+
+from sqlalchemy import func, select, text
+
+from benchmark import dataset_copy, ensure_dataset
+from database import FEED_ROW_COLUMNS, FEED_SORTS, db_manager, search_terms
+from models import db, Account, Product, Purchase
+from web_server import create_app
+
+# Полное чтение таблицы (без индекса) и сортировка во временном B-дереве
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+SORT = 'USE TEMP B-TREE'
+PRICE_RANGES = ((None, None), (500, None), (None, 800), (500, 800))
+CATALOG_CASES = list(itertools.product(FEED_SORTS, (False, True), PRICE_RANGES, (False, True)))
+# Слова из названий и описаний generate_dataset.py: редкое, частое и из двух слов
+SEARCH_QUERIES = ('закат', 'произв', 'уникальный пейзаж')
+SEARCH_CASES = list(itertools.product(SEARCH_QUERIES, (False, True)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check catalog query plans for full scans and sorts")
+    parser.add_argument('--data-dir', default='bench_data', help="dataset database and uploads")
+    parser.add_argument('--accounts', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--purchases', type=int, default=50000)
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--analyze', action='store_true', help="run ANALYZE first (planner statistics)")
+    return parser.parse_args()
+
+
+def sample_params():
+    """Аккаунт, товар и курсоры из середины выборок - аргументы проверяемых запросов"""
+    creator_id, product_id = db.session.execute(
+        select(Product.creator_id, Product.id).order_by(func.random()).limit(1)
+    ).one()
+    account_id = db.session.execute(select(Purchase.account_id).limit(1)).scalar()
+    middle = db.session.execute(select(func.count(Product.id))).scalar() // 2
+    cursors = {}
+    for sort, (key, _, _) in FEED_SORTS.items():
+        row = db.session.execute(select(key, Product.id).order_by(key, Product.id).offset(middle).limit(1)).one()
+        cursors[sort] = tuple(row)
+    search_cursors = {}
+    for query in SEARCH_QUERIES:
+        rows = db.session.execute(db_manager._search_page(search_terms(query), 50, None)).all()
+        if rows:
+            search_cursors[query] = (rows[-1].rank, rows[-1].search_key)
+    return {'creator_id': creator_id, 'product_id': product_id, 'account_id': account_id,
+            'cursors': cursors, 'search_cursors': search_cursors}
+
+
+def catalog_statement(params, sort, with_creator, price_range, paged):
+    """(название, select) страницы /api/product с этими параметрами"""
+    min_price, max_price = price_range
+    statement = select(*FEED_ROW_COLUMNS).outerjoin(Account, Account.id == Product.creator_id)
+    statement = db_manager._feed_page(
+        statement, 1, 6, params['cursors'][sort] if paged else None, sort=sort,
+        creator_id=params['creator_id'] if with_creator else None, min_price=min_price, max_price=max_price
+    )
+    name = (f"feed sort={sort} creator={'yes' if with_creator else 'no'} "
+            f"price={min_price}..{max_price} {'after' if paged else 'page'}")
+    return name, statement
+
+
+def search_statement(params, query, paged):
+    """(название, select) страницы /api/product/search"""
+    after = params['search_cursors'].get(query) if paged else None
+    return f"search q={query} {'after' if paged else 'page'}", db_manager._search_page(search_terms(query), 6, after)
+
+
+def other_statements(params):
+    """Остальные горячие запросы: профиль и покупатели"""
+    profile_posted = (
+        select(Product.id).where(Product.creator_id == params['account_id'], Product.status == Product.STATUS_READY)
+        .order_by(Product.updated_at.desc(), Product.id.desc()).limit(20)
+    )
+    profile_bayed = (
+        select(Purchase.id, Product.id).join(Product, Product.id == Purchase.product_id)
+        .where(Purchase.account_id == params['account_id'])
+        .order_by(Purchase.purchased_at.desc(), Purchase.id.desc()).limit(20)
+    )
+    buyers = (
+        select(Account.id).join(Purchase, Purchase.account_id == Account.id)
+        .where(Purchase.product_id == params['product_id']).order_by(Purchase.purchased_at.desc()).limit(6)
+    )
+    yield 'profile posted', profile_posted
+    yield 'profile bayed', profile_bayed
+    yield 'buyers', buyers
+
+
+def all_statements(params):
+    for case in CATALOG_CASES:
+        yield catalog_statement(params, *case)
+    for case in SEARCH_CASES:
+        yield search_statement(params, *case)
+    yield from other_statements(params)
+
+
+def explain(statement):
+    sql = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[3] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def problems(plan):
+    found = []
+    for step in plan:
+        match = FULL_SCAN.match(step)
+        if match:
+            found.append(f"full scan of {match.group(1)}")
+        if step.startswith(SORT):
+            found.append(f"sort without index ({step})")
+    return found
+
+
+def check_query_plans():
+    args = parse_args()
+    # ANALYZE пишет статистику в базу - работаем с копией, чтобы не менять планы бенчмарка
+    with dataset_copy(*ensure_dataset(args)) as (database_path, uploads):
+        failures = check_dataset(args, database_path, uploads)
+    if failures:
+        print(f"\n❌ Запросов с полным сканированием или сортировкой: {failures}")
+        sys.exit(1)
+    print("\n🎉 Все запросы читают данные по индексам")
+
+
+def check_dataset(args, database_path, uploads) -> int:
+    """Проверяет планы на наборе данных; возвращает число запросов с проблемами"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}", 'UPLOAD_FOLDER': uploads})
+
+    failures = 0
+    with app.app_context():
+        if args.analyze:
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+        params = sample_params()
+        print(f"🔍 Планы запросов: {database_path}")
+        for name, statement in all_statements(params):
+            plan = explain(statement)
+            started = time.perf_counter()
+            db.session.execute(statement).all()
+            elapsed = (time.perf_counter() - started) * 1000
+            found = problems(plan)
+            failures += bool(found)
+            mark = '❌' if found else '✅'
+            print(f"   {mark} {name:60} {elapsed:8.2f} ms  {' | '.join(plan)}")
+            for problem in found:
+                print(f"      ⚠️ {problem}")
+        db.engine.dispose()
+    return failures
+
+
+if __name__ == "__main__":
+    check_query_plans()
@@ -1,8 +1,100 @@
-from models import db, Account, Product, Purchase
-from flask import Flask
+import re
+from datetime import datetime
+from models import db, canonical_uuid, Account, Product, Purchase, generate_uuid
+from flask import Flask, current_app
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import and_, case, column, desc, event, literal_column, or_, select, table, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload, load_only
+from passwords import PasswordHasher
+from ttl_cache import TTLCache
+import migrations
+
+# Колонки, которые реально попадают в ответ ленты (Product.to_dict)
+FEED_PRODUCT_COLUMNS = (
+    Product.id, Product.photo_url, Product.creator_id, Product.title,
+    Product.price, Product.description, Product.updated_at,
+)
+# Публичные колонки аккаунта (Account.to_dict) - без хэша пароля
+PUBLIC_ACCOUNT_COLUMNS = (Account.id, Account.nickname, Account.mail, Account.created_at)
+
+# Колонки ленты для Core-запроса без ORM-объектов (serializers.feed_product)
+FEED_ROW_COLUMNS = (
+    Product.id, Product.photo_url, Product.title, Product.price, Product.description, Product.updated_at,
+    Account.id.label('creator_id'), Account.nickname.label('creator_nickname'),
+    Account.mail.label('creator_mail'), Account.created_at.label('creator_created_at'),
+    Product.buyers_count,
+)
+
+# Порядки каталога (?sort=): колонка ключа, по убыванию ли, тип значения в курсоре.
+# Второй ключ всегда id; каждому порядку соответствует индекс (key, id) и (creator_id, key, id)
+FEED_SORTS = {
+    'recent': (Product.updated_at, True, datetime),
+    'price': (Product.price, False, int),
+    'popular': (Product.buyers_count, True, int),
+}
+
+# PRAGMA для каждого соединения с SQLite: WAL - читатели не блокируются писателем,
+# busy_timeout - писатели ждут блокировку вместо мгновенного "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # отрицательное значение - в KiB (~64MB)
+}
+
+# Пересчет денормализованного счетчика по таблице покупок (после массовой загрузки)
+RECOUNT_BUYERS = (
+    "UPDATE products SET buyers_count = "
+    "(SELECT COUNT(*) FROM purchases WHERE purchases.product_id = products.id)"
+)
+
+def engine_options(config) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS по URI: пул соединений для серверных СУБД (PostgreSQL и т.п.)"""
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def _apply_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+# Полнотекстовый поиск по товарам (SQLite FTS5, см. migrations/v005_product_search.py):
+# индекс связан с products по rowid и обновляется триггерами при любой записи в products
+SEARCH_TABLE = 'products_fts'
+SEARCH_INDEX = table(SEARCH_TABLE, column('rowid'), column('rank'), column(SEARCH_TABLE))
+SEARCH_TITLE_WEIGHT = 10.0  # Совпадение в названии весит больше, чем в описании
+SEARCH_RANK = f'bm25({SEARCH_TITLE_WEIGHT}, 1.0)'
+SEARCH_MAX_TERMS = 8
+_SEARCH_TERM = re.compile(r'\w+')
+
+
+def seek_key(columns, after):
+    """(ключ, граница) для seek-пагинации; значения курсора получают типы колонок,
+    иначе id из курсора ушел бы в запрос строкой, а не байтами BinaryUUID"""
+    return tuple_(*columns), tuple_(*after, types=[key.type for key in columns])
+
+
+def search_terms(query: str) -> list:
+    """Слова поискового запроса (без операторов FTS5 - их пользователь не вводит)"""
+    return _SEARCH_TERM.findall(query or '')[:SEARCH_MAX_TERMS]
+
+# Диалекты с INSERT ... ON CONFLICT DO NOTHING
+UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
 
 class DatabaseManager:
     def __init__(self, app: Flask = None):
@@ -11,13 +103,31 @@ class DatabaseManager:
     
     def init_app(self, app: Flask):
         db.init_app(app)
+        # Кэш строк аккаунтов: аутентификация и профили без запроса в базу на каждый вызов
+        app.extensions['account_cache'] = TTLCache(
+            maxsize=app.config.get('ACCOUNT_CACHE_SIZE', 1024),
+            ttl=app.config.get('ACCOUNT_CACHE_TTL', 300)
+        )
+        # Хэширование паролей - в своем ограниченном пуле (поток запроса ждет результат)
+        app.extensions['password_hasher'] = PasswordHasher(
+            method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+            max_workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+            max_pending=app.config.get('PASSWORD_HASH_QUEUE_SIZE', 16),
+            wait_timeout=app.config.get('PASSWORD_HASH_WAIT', 5)
+        )
         with app.app_context():
-            db.create_all()
+            if db.engine.dialect.name == 'sqlite':
+                pragmas = app.config.get('SQLITE_PRAGMAS', SQLITE_PRAGMAS)
+                event.listen(db.engine, 'connect',
+                             lambda dbapi_connection, record: _apply_sqlite_pragmas(pragmas, dbapi_connection, record))
+            # Схему меняет только python -m migrations; здесь - одна проверка версии
+            if app.config.get('DB_SCHEMA_CHECK', True):
+                migrations.check(db.engine)
     
     # Account methods
     def create_account(self, nickname: str, mail: str, password: str) -> Account:
         # Генерация хэша пароля
-        password_hash = generate_password_hash(password)
+        password_hash = current_app.extensions['password_hasher'].hash(password)
         account = Account(nickname=nickname, mail=mail, password=password_hash)
         db.session.add(account)
         try:
@@ -29,70 +139,383 @@ class DatabaseManager:
     
     def get_account_by_credentials(self, nickname: str, password: str) -> Account:
         account = Account.query.filter_by(nickname=nickname).first()
-        if account and check_password_hash(account.password, password):
-            return account
-        return None
+        hasher = current_app.extensions['password_hasher']
+        if not account or not hasher.verify(account.password, password):
+            return None
+        
+        # Пароль верный - прозрачно пересчитываем хэш с устаревшими параметрами
+        if hasher.needs_rehash(account.password):
+            account.password = hasher.hash(password)
+            db.session.commit()
+            self.invalidate_account(account.id)
+        return account
     
     def get_account_by_id(self, account_id: str) -> Account:
         return Account.query.get(account_id)
     
+    def get_account_cached(self, account_id: str) -> Account:
+        """Аккаунт через TTL/LRU кэш.
+
+        В кэше лежит отсоединенная копия строки; merge(load=False) привязывает ее
+        к текущей сессии без SQL-запроса, связи при этом грузятся как обычно.
+        """
+        cache = current_app.extensions['account_cache']
+        cached = cache.get(account_id)
+        if cached is None:
+            cached = Account.query.get(account_id)
+            if cached is None:
+                return None
+            db.session.expunge(cached)
+            cache.set(account_id, cached)
+        return db.session.merge(cached, load=False)
+    
+    def _response_cache(self):
+        """Кэш ответов каталога (None, если приложение его не настроило)"""
+        return current_app.extensions.get('response_cache')
+    
+    def invalidate_account(self, account_id: str):
+        current_app.extensions['account_cache'].pop(account_id)
+    
     def get_account_by_nickname(self, nickname: str) -> Account:
         return Account.query.filter_by(nickname=nickname).first()
     
     # Product methods
     def create_product(self, photo_url: str, creator_id: str, title: str, 
-                      price: int, description: str) -> Product:
+                      price: int, description: str, status: str = Product.STATUS_READY) -> Product:
         product = Product(
             photo_url=photo_url,
             creator_id=creator_id,
             title=title,
             price=price,
-            description=description
+            description=description,
+            status=status
         )
         db.session.add(product)
         db.session.commit()
+        
+        # Товар в обработке появится в ленте только после set_product_status
+        cache = self._response_cache()
+        if cache and status == Product.STATUS_READY:
+            cache.invalidate_feed()
         return product
     
     def get_product(self, product_id: str) -> Product:
         return Product.query.get(product_id)
     
-    def get_products_paginated(self, page: int = 1, per_page: int = 10):
-        return Product.query.order_by(desc(Product.updated_at)).paginate(
-            page=page, per_page=per_page, error_out=False
+    def get_products_paginated(self, page: int = 1, per_page: int = 10, after: tuple = None, **filters):
+        """Страница ленты одним запросом: создатели через JOIN, без COUNT от paginate().
+
+        after - ключ (значение сортировки, id) последнего товара предыдущей страницы;
+        если передан, страница ищется по индексу вместо OFFSET. filters - см. _feed_page.
+        """
+        query = Product.query.options(
+            load_only(*FEED_PRODUCT_COLUMNS),
+            joinedload(Product.creator).load_only(*PUBLIC_ACCOUNT_COLUMNS),
+        )
+        return self._feed_page(query, page, per_page, after, **filters).all()
+    
+    def get_feed_rows(self, page: int = 1, per_page: int = 10, after: tuple = None, **filters):
+        """Та же страница ленты, но кортежами колонок (FEED_ROW_COLUMNS) без сборки ORM-объектов"""
+        statement = select(*FEED_ROW_COLUMNS).outerjoin(Account, Account.id == Product.creator_id)
+        return db.session.execute(self._feed_page(statement, page, per_page, after, **filters)).all()
+    
+    def _feed_page(self, statement, page, per_page, after, sort: str = 'recent',
+                   min_price: int = None, max_price: int = None, creator_id: str = None):
+        """Фильтры, порядок и границы страницы ленты - общие для Query и select().
+
+        sort - ключ FEED_SORTS; цена и автор сужают выборку, не меняя индекс порядка.
+        """
+        key, descending, _ = FEED_SORTS[sort]
+        statement = statement.where(Product.status == Product.STATUS_READY)
+        if creator_id is not None:
+            statement = statement.where(Product.creator_id == creator_id)
+        # Вне сортировки по цене диапазон проверяется на строках индекса порядка:
+        # price + 0 не дает планировщику взять ix_products_price_id и сортировать
+        # весь диапазон ради первых per_page строк
+        price = Product.price if sort == 'price' else Product.price + 0
+        if min_price is not None:
+            statement = statement.where(price >= min_price)
+        if max_price is not None:
+            statement = statement.where(price <= max_price)
+        
+        if descending:
+            statement = statement.order_by(desc(key), desc(Product.id))
+        else:
+            statement = statement.order_by(key, Product.id)
+        if after is not None:
+            seek, bound = seek_key((key, Product.id), after)
+            statement = statement.where(seek < bound if descending else seek > bound)
+        else:
+            statement = statement.offset((max(page, 1) - 1) * per_page)
+        return statement.limit(per_page)
+    
+    def search_product_rows(self, query: str, limit: int = 10, after: tuple = None):
+        """Поиск по названию и описанию: строки FEED_ROW_COLUMNS плюс rank (меньше - релевантнее)
+        и search_key - второй элемент ключа страницы.
+
+        Каждое слово запроса ищется как префикс, нужны все слова. В SQLite - индекс
+        FTS5 с ранжированием bm25, в остальных СУБД - LIKE без индекса (совпадения в
+        названии выше). after - ключ (rank, search_key) последней строки предыдущей страницы.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        return db.session.execute(self._search_page(terms, limit, after)).all()
+    
+    def _search_page(self, terms: list, limit: int, after: tuple):
+        """select() страницы поиска по уже разобранным словам (см. search_product_rows)"""
+        if db.engine.dialect.name == 'sqlite':
+            # Порядок отдает сам FTS5 (ORDER BY rank, ранжирование задано rank MATCH),
+            # без сортировки выборки во временном B-дереве; при равном rank строки
+            # идут по возрастанию rowid, поэтому ключ страницы - (rank, rowid)
+            rank = SEARCH_INDEX.c.rank
+            key = (rank, SEARCH_INDEX.c.rowid)
+            statement = (
+                select(*FEED_ROW_COLUMNS, rank.label('rank'), SEARCH_INDEX.c.rowid.label('search_key'))
+                .select_from(SEARCH_INDEX)
+                .join(Product, literal_column('products.rowid') == SEARCH_INDEX.c.rowid)
+                .where(SEARCH_INDEX.c[SEARCH_TABLE].match(' '.join(f'"{term}"*' for term in terms)),
+                       rank.match(SEARCH_RANK))
+                .order_by(rank)
+            )
+        else:
+            title_matches = and_(*(Product.title.ilike(f"%{term}%") for term in terms))
+            rank = case((title_matches, 0.0), else_=1.0)
+            key = (rank, Product.id)
+            statement = (
+                select(*FEED_ROW_COLUMNS, rank.label('rank'), Product.id.label('search_key'))
+                .where(*(or_(Product.title.ilike(f"%{term}%"), Product.description.ilike(f"%{term}%"))
+                         for term in terms))
+                .order_by(*key)
+            )
+        
+        statement = (
+            statement
+            .outerjoin(Account, Account.id == Product.creator_id)
+            .where(Product.status == Product.STATUS_READY)
+            .limit(limit)
         )
+        if after is not None:
+            seek, bound = seek_key(key, after)
+            statement = statement.where(seek > bound)
+        return statement
     
-    def get_user_products(self, account_id: str):
-        return Product.query.filter_by(creator_id=account_id).order_by(desc(Product.updated_at)).all()
+    def get_user_products(self, account_id: str, limit: int = None, after: tuple = None,
+                          include_unready: bool = False):
+        """Товары автора одним запросом по индексу (creator_id, updated_at, id).
+
+        after - ключ (updated_at, id) последнего товара предыдущей страницы.
+        Товары в processing/failed видит только сам автор (include_unready=True).
+        """
+        query = (
+            Product.query
+            .options(load_only(*FEED_PRODUCT_COLUMNS))
+            .filter(Product.creator_id == account_id)
+            .order_by(desc(Product.updated_at), desc(Product.id))
+        )
+        if not include_unready:
+            query = query.filter(Product.status == Product.STATUS_READY)
+        if after is not None:
+            seek, bound = seek_key((Product.updated_at, Product.id), after)
+            query = query.filter(seek < bound)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
     
-    def get_purchased_products(self, account_id: str):
-        purchases = Purchase.query.filter_by(account_id=account_id).order_by(desc(Purchase.purchased_at)).all()
-        return [purchase.product for purchase in purchases]
+    def get_account_purchases(self, account_id: str, limit: int = None, after: tuple = None):
+        """Покупки аккаунта вместе с товарами одним запросом (JOIN по индексу account_id, purchased_at, id).
+
+        after - ключ (purchased_at, id) последней покупки предыдущей страницы.
+        """
+        query = (
+            Purchase.query
+            .options(
+                load_only(Purchase.id, Purchase.product_id, Purchase.purchased_at),
+                joinedload(Purchase.product, innerjoin=True).load_only(*FEED_PRODUCT_COLUMNS),
+            )
+            .filter(Purchase.account_id == account_id)
+            .order_by(desc(Purchase.purchased_at), desc(Purchase.id))
+        )
+        if after is not None:
+            seek, bound = seek_key((Purchase.purchased_at, Purchase.id), after)
+            query = query.filter(seek < bound)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+    
+    def get_purchased_products(self, account_id: str, limit: int = None, after: tuple = None):
+        return [purchase.product for purchase in self.get_account_purchases(account_id, limit, after)]
     
     def update_product_description(self, product_id: str, description: str) -> Product:
         product = Product.query.get(product_id)
         if product:
             product.description = description
             db.session.commit()
+            
+            cache = self._response_cache()
+            if cache:
+                cache.invalidate_product(product_id)
+                cache.invalidate_feed()
+        return product
+    
+    def set_product_status(self, product_id: str, status: str, error: str = None) -> Product:
+        """Фиксирует результат фоновой обработки изображения"""
+        product = Product.query.get(product_id)
+        if product:
+            previous_status = product.status
+            product.status = status
+            product.processing_error = error
+            db.session.commit()
+            
+            cache = self._response_cache()
+            if cache:
+                cache.invalidate_product(product_id)
+                if Product.STATUS_READY in (previous_status, status):
+                    cache.invalidate_feed()
         return product
     
+    def fail_stale_products(self, older_than: datetime, error: str) -> int:
+        """Переводит в failed товары, застрявшие в processing дольше older_than.
+
+        Очередь обработки живет в памяти процесса: после перезапуска или падения
+        их задачи потеряны, а оригинал до обработки не сохраняется - повторить нечего.
+        """
+        product_ids = db.session.execute(
+            select(Product.id).where(Product.status == Product.STATUS_PROCESSING, Product.updated_at < older_than)
+        ).scalars().all()
+        if product_ids:
+            Product.query.filter(Product.id.in_(product_ids)).update(
+                {Product.status: Product.STATUS_FAILED, Product.processing_error: error},
+                synchronize_session=False
+            )
+            db.session.commit()
+            
+            cache = self._response_cache()
+            if cache:
+                for product_id in product_ids:
+                    cache.invalidate_product(product_id)
+        return len(product_ids)
+    
     # Purchase methods
+    PURCHASE_CREATED = 'purchased'
+    PURCHASE_EXISTS = 'already_purchased'
+    PURCHASE_NOT_FOUND = 'not_found'
+    
     def create_purchase(self, account_id: str, product_id: str) -> Purchase:
-        # Check if purchase already exists
-        existing_purchase = Purchase.query.filter_by(
-            account_id=account_id, product_id=product_id
-        ).first()
+        """Идемпотентная покупка: повторный вызов возвращает уже существующую"""
+        purchase, _ = self.create_purchases(account_id, [product_id])[product_id]
+        return purchase
+    
+    def create_purchases(self, account_id: str, product_ids: list) -> dict:
+        """Покупка корзины одной транзакцией.
+
+        Возвращает {product_id: (purchase | None, PURCHASE_CREATED | PURCHASE_EXISTS | PURCHASE_NOT_FOUND)}
+        с ключами в написании вызывающего; PURCHASE_NOT_FOUND - товара нет, id не UUID
+        или товар не в статусе ready. Повторы отсекает уникальный индекс
+        (account_id, product_id) через ON CONFLICT DO NOTHING, поэтому параллельные
+        запросы не создают дублей.
+        """
+        # База возвращает id в канонической записи: по ней и ищем, и сравниваем
+        canonical_ids = {product_id: canonical_uuid(product_id) for product_id in product_ids}
+        lookup_ids = list(dict.fromkeys(product_id for product_id in canonical_ids.values() if product_id))
+        # Товар, изображение которого еще обрабатывается или не обработалось, купить нельзя
+        found_ids = set()
+        if lookup_ids:
+            found_ids = set(db.session.execute(
+                select(Product.id).where(Product.id.in_(lookup_ids), Product.status == Product.STATUS_READY)
+            ).scalars())
         
-        if existing_purchase:
-            return existing_purchase
+        created_ids = set()
+        rows = [
+            {'id': generate_uuid(), 'account_id': account_id, 'product_id': product_id,
+             'purchased_at': datetime.utcnow()}
+            for product_id in lookup_ids if product_id in found_ids
+        ]
+        if rows:
+            created_ids = self._insert_purchases(rows)
+            if created_ids:
+                # Счетчик покупателей обновляется в той же транзакции, что и покупки;
+                # updated_at задаем явно, иначе onupdate поднимет товары в ленте
+                Product.query.filter(Product.id.in_(created_ids)).update(
+                    {Product.buyers_count: Product.buyers_count + 1, Product.updated_at: Product.updated_at},
+                    synchronize_session=False
+                )
         
-        purchase = Purchase(account_id=account_id, product_id=product_id)
-        db.session.add(purchase)
+        purchases = {}
+        if found_ids:
+            purchases = {
+                purchase.product_id: purchase
+                for purchase in Purchase.query.filter(
+                    Purchase.account_id == account_id, Purchase.product_id.in_(found_ids)
+                )
+            }
         db.session.commit()
-        return purchase
+        
+        # Покупки меняют buyers_count: порядок ?sort=popular, карточки и покупателей.
+        # Остальные порядки ленты от них не зависят (updated_at не меняется)
+        cache = self._response_cache()
+        if cache and created_ids:
+            cache.invalidate_popular_feed()
+            for product_id in created_ids:
+                cache.invalidate_product(product_id, buyers=True)
+        
+        results = {}
+        for product_id, canonical_id in canonical_ids.items():
+            if canonical_id not in found_ids:
+                results[product_id] = (None, self.PURCHASE_NOT_FOUND)
+            elif canonical_id in created_ids:
+                results[product_id] = (purchases.get(canonical_id), self.PURCHASE_CREATED)
+            else:
+                results[product_id] = (purchases.get(canonical_id), self.PURCHASE_EXISTS)
+        return results
+    
+    def _insert_purchases(self, rows: list) -> set:
+        """Вставляет покупки, пропуская уже существующие; возвращает product_id вставленных"""
+        upsert = UPSERT_INSERTS.get(db.engine.dialect.name)
+        if upsert:
+            statement = (
+                upsert(Purchase)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=['account_id', 'product_id'])
+                .returning(Purchase.product_id)
+            )
+            return set(db.session.execute(statement).scalars())
+        
+        # Остальные СУБД: по строке в SAVEPOINT, конфликт уникального индекса = уже куплено
+        created = set()
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(Purchase.__table__.insert().values(row))
+                created.add(row['product_id'])
+            except IntegrityError:
+                pass
+        return created
     
-    def get_product_buyers(self, product_id: str):
-        purchases = Purchase.query.filter_by(product_id=product_id).order_by(desc(Purchase.purchased_at)).all()
-        return [purchase.account for purchase in purchases]
+    def get_product_buyers(self, product_id: str, limit: int = None):
+        """Последние покупатели товара одним запросом (JOIN по индексу product_id, purchased_at)"""
+        query = (
+            Account.query
+            .options(load_only(*PUBLIC_ACCOUNT_COLUMNS))
+            .join(Purchase, Purchase.account_id == Account.id)
+            .filter(Purchase.product_id == product_id)
+            .order_by(desc(Purchase.purchased_at))
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+    
+    def get_product_buyer_rows(self, product_id: str, limit: int = None):
+        """Последние покупатели кортежами PUBLIC_ACCOUNT_COLUMNS (для serializers.public_account)"""
+        statement = (
+            select(*PUBLIC_ACCOUNT_COLUMNS)
+            .join(Purchase, Purchase.account_id == Account.id)
+            .where(Purchase.product_id == product_id)
+            .order_by(desc(Purchase.purchased_at))
+        )
+        if limit is not None:
+            statement = statement.limit(limit)
+        return db.session.execute(statement).all()
     
     def has_user_purchased_product(self, account_id: str, product_id: str) -> bool:
         return Purchase.query.filter_by(account_id=account_id, product_id=product_id).first() is not None
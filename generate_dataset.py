@@ -0,0 +1,259 @@
+"""Генератор больших наборов данных для нагрузочного тестирования.
+
+В отличие от seed.py пишет пачками (executemany по BATCH строк в транзакции),
+хэширует общий пароль один раз и рендерит изображения в пуле процессов.
+Один и тот же --seed дает одинаковые ID, тексты, даты и картинки.
+
+    python generate_dataset.py --accounts 100000 --products 500000 --purchases 2000000 \\
+        --database sqlite:///load.db --uploads uploads_load
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image, ImageDraw
+from sqlalchemy import insert, select, text
+
+import migrations
+from database import RECOUNT_BUYERS
+from image_pipeline import process_image
+from models import db, uuid7, Account, Product, Purchase
+from storage import content_hash
+from web_server import create_app
+
+# Все даты набора отсчитываются от фиксированного момента - иначе он не воспроизводим
+BASE_TIME = datetime(2025, 1, 1)
+SPAN_SECONDS = 365 * 24 * 3600
+
+ADJECTIVES = [
+    "Великолепный", "Прекрасный", "Удивительный", "Завораживающий", "Волшебный",
+    "Изумительный", "Потрясающий", "Невероятный", "Восхитительный", "Уникальный",
+]
+SUBJECTS = ["закат", "портрет", "натюрморт", "пейзаж", "город", "океан", "лес", "абстракция"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk dataset generator for load testing")
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--purchases', type=int, default=20000, help="unique (account, product) pairs")
+    parser.add_argument('--images', type=int, default=50, help="distinct images shared by products")
+    parser.add_argument('--image-source', choices=['synthetic', 'examples'], default='synthetic',
+                        help="generated pictures or files from photo_examples/")
+    parser.add_argument('--image-size', type=int, default=1600, help="synthetic image width")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="image processes")
+    parser.add_argument('--batch', type=int, default=10000, help="rows per INSERT transaction")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='123456', help="shared password of all accounts")
+    parser.add_argument('--prefix', default='load', help="nickname prefix")
+    parser.add_argument('--database', help="SQLALCHEMY_DATABASE_URI (default: app config)")
+    parser.add_argument('--uploads', help="UPLOAD_FOLDER for generated images (default: app config)")
+    args = parser.parse_args()
+    if args.products and not args.accounts:
+        parser.error("--products requires at least one account")
+    return args
+
+
+def seeded_uuid(rng: random.Random, moment: datetime) -> str:
+    """UUIDv7 со временем записи: ключи упорядочены так же, как в живой базе"""
+    unix_ms = int(moment.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return str(uuid7(unix_ms, rng.getrandbits(80)))
+
+
+def seeded_time(rng: random.Random) -> datetime:
+    return BASE_TIME + timedelta(seconds=rng.randrange(SPAN_SECONDS), microseconds=rng.randrange(1000000))
+
+
+def synthetic_image(seed: int, number: int, width: int) -> bytes:
+    """Детерминированная картинка: градиент и фигуры (JPEG, 4:3)"""
+    rng = random.Random(f"{seed}:{number}")
+    height = width * 3 // 4
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    tint = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    image = Image.blend(image, tint, 0.6)
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randrange(width // 20, width // 4)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse((x, y, x + size, y + size), fill=color)
+        else:
+            draw.rectangle((x, y, x + size, y + size // 2), fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def build_image(task):
+    """Рабочий процесс: получает/рисует картинку и прогоняет ее через общий пайплайн"""
+    source, storage, max_dimension, max_pixels = task
+    if isinstance(source, str):
+        with open(source, 'rb') as image_source:
+            data = image_source.read()
+    else:
+        data = synthetic_image(*source)
+    return process_image(data, content_hash(data), storage, max_dimension, max_pixels)
+
+
+def generate_images(app, args):
+    """file_id изображений набора; уже обработанные (по хэшу) не рендерятся повторно"""
+    storage = app.extensions['storage']
+    image_index = app.extensions['image_index']
+
+    if args.image_source == 'examples':
+        folder = 'photo_examples'
+        names = sorted(name for name in os.listdir(folder)
+                       if name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')))
+        sources = [os.path.join(folder, name) for name in names[:args.images]]
+    else:
+        sources = [(args.seed, number, args.image_size) for number in range(args.images)]
+
+    tasks = [(source, storage, app.config['MAX_IMAGE_DIMENSION'], app.config['MAX_IMAGE_PIXELS'])
+             for source in sources]
+    file_ids = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(args.workers, 1), mp_context=context) as pool:
+        for image_info, error in pool.map(build_image, tasks, chunksize=4):
+            if error:
+                print(f"   ❌ Ошибка обработки изображения: {error}")
+                continue
+            if not image_index.get(image_info['file_id']):
+                image_index.register(image_info)
+            file_ids.append(image_info['file_id'])
+    return file_ids
+
+
+def insert_batches(model, rows, batch: int, label: str):
+    """executemany пачками по batch строк, коммит на пачку"""
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == batch:
+            db.session.execute(insert(model), chunk)
+            db.session.commit()
+            total += len(chunk)
+            chunk = []
+            print(f"   ⏳ {label}: {total}")
+    if chunk:
+        db.session.execute(insert(model), chunk)
+        db.session.commit()
+        total += len(chunk)
+    return total
+
+
+def account_rows(rng, args, password_hash, ids):
+    for number in range(args.accounts):
+        created_at = seeded_time(rng)
+        account_id = seeded_uuid(rng, created_at)
+        ids.append(account_id)
+        nickname = f"{args.prefix}_{number + 1}"
+        yield {
+            'id': account_id,
+            'nickname': nickname,
+            'mail': f"{nickname}@example.com",
+            'password': password_hash,
+            'created_at': created_at,
+        }
+
+
+def product_rows(rng, args, account_ids, file_ids, ids):
+    for number in range(args.products):
+        updated_at = seeded_time(rng)
+        product_id = seeded_uuid(rng, updated_at)
+        ids.append(product_id)
+        yield {
+            'id': product_id,
+            'photo_url': rng.choice(file_ids),
+            'creator_id': rng.choice(account_ids),
+            'title': f"{rng.choice(ADJECTIVES)} {rng.choice(SUBJECTS)} #{number + 1}",
+            'price': rng.randint(100, 2000),
+            'description': "Прекрасное произведение искусства",
+            'updated_at': updated_at,
+            'buyers_count': 0,
+            'status': Product.STATUS_READY,
+        }
+
+
+def purchase_rows(rng, args, account_ids, product_ids):
+    """Уникальные пары (account, product): пара кодируется одним int, чтобы множество было компактным"""
+    limit = min(args.purchases, len(account_ids) * len(product_ids))
+    seen = set()
+    while len(seen) < limit:
+        pair = rng.randrange(len(account_ids)) * len(product_ids) + rng.randrange(len(product_ids))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        account_number, product_number = divmod(pair, len(product_ids))
+        purchased_at = seeded_time(rng)
+        yield {
+            'id': seeded_uuid(rng, purchased_at),
+            'account_id': account_ids[account_number],
+            'product_id': product_ids[product_number],
+            'purchased_at': purchased_at,
+        }
+
+
+def generate_dataset():
+    args = parse_args()
+    # Схема создается миграциями ниже, до первого запроса к базе
+    overrides = {'IMAGE_WORKERS': 0, 'DB_SCHEMA_CHECK': False}
+    if args.database:
+        overrides['SQLALCHEMY_DATABASE_URI'] = args.database
+    if args.uploads:
+        overrides['UPLOAD_FOLDER'] = args.uploads
+    app = create_app(overrides)
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        migrations.upgrade(db.engine.url)
+        print("🚀 Генерация набора данных...")
+        print(f"   👥 Аккаунтов: {args.accounts}  🎨 Артов: {args.products}  💰 Покупок: {args.purchases}")
+        print(f"   🌱 seed: {args.seed}  🖼️ Изображений: {args.images} ({args.image_source})")
+
+        taken = db.session.execute(
+            select(Account.id).where(Account.nickname == f"{args.prefix}_1")
+        ).first()
+        if taken:
+            print(f"❌ Аккаунты с префиксом '{args.prefix}' уже есть - укажите другой --prefix или пустую базу")
+            return
+
+        started = time.time()
+        print("🖼️ Рендерим изображения...")
+        file_ids = generate_images(app, args)
+        if not file_ids:
+            print("❌ Нет изображений для артов")
+            return
+        print(f"   ✅ {len(file_ids)} изображений за {time.time() - started:.1f}s")
+
+        # Один хэш на всех: стоимость scrypt платится один раз, а не на каждый аккаунт
+        password_hash = app.extensions['password_hasher'].hash(args.password)
+
+        step = time.time()
+        account_ids = []
+        insert_batches(Account, account_rows(rng, args, password_hash, account_ids), args.batch, "аккаунты")
+        print(f"   ✅ Аккаунты: {len(account_ids)} за {time.time() - step:.1f}s")
+
+        step = time.time()
+        product_ids = []
+        insert_batches(Product, product_rows(rng, args, account_ids, file_ids, product_ids), args.batch, "арты")
+        print(f"   ✅ Арты: {len(product_ids)} за {time.time() - step:.1f}s")
+
+        step = time.time()
+        purchases = insert_batches(Purchase, purchase_rows(rng, args, account_ids, product_ids), args.batch, "покупки")
+        # Денормализованный счетчик - одним UPDATE по всем товарам
+        db.session.execute(text(RECOUNT_BUYERS))
+        db.session.commit()
+        print(f"   ✅ Покупки: {purchases} за {time.time() - step:.1f}s")
+
+        print(f"\n🎉 Готово за {time.time() - started:.1f}s, пароль всех аккаунтов: \"{args.password}\"")
+
+
+if __name__ == "__main__":
+    generate_dataset()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+
+from storage import StorageBackend
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+class ImageIndex:
+    """In-process индекс file_id -> ключи файлов изображений в хранилище.
+
+    Каждая загрузка дописывается строкой в manifest.jsonl, поэтому поиск файла
+    не требует os.listdir: при старте индекс собирается один раз из манифеста
+    и старых файлов, дальше поддерживается при загрузках.
+    """
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        # Манифест и старые файлы - в локальном каталоге бэкенда (StorageBackend.root)
+        self.upload_folder = storage.root
+        self.manifest_path = os.path.join(self.upload_folder, MANIFEST_NAME)
+        self._entries = {}
+        self._manifest_offset = 0
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        """Полная пересборка индекса: старые файлы <id>_<rendition>.<ext> + манифест"""
+        entries = {}
+        self._scan_legacy(entries, self.upload_folder, 'original', '')
+        self._scan_legacy(entries, os.path.join(self.upload_folder, 'thumbnails'), 'thumbnail', 'thumbnails')
+
+        with self._lock:
+            self._entries = entries
+            self._manifest_offset = 0
+            self._read_manifest()
+
+    def _scan_legacy(self, entries, directory, rendition, prefix):
+        """Файлы, загруженные до появления манифеста"""
+        if not os.path.isdir(directory):
+            return
+        marker = f"_{rendition}."
+        with os.scandir(directory) as it:
+            for dir_entry in it:
+                if not dir_entry.is_file() or marker not in dir_entry.name:
+                    continue
+                file_id, extension = dir_entry.name.split(marker, 1)
+                entry = entries.setdefault(file_id, {'file_id': file_id})
+                entry[rendition] = f"{prefix}/{dir_entry.name}" if prefix else dir_entry.name
+                entry.setdefault('format', extension.lower())
+
+    def _read_manifest(self):
+        """Дочитывает новые строки манифеста (их могли дописать другие процессы)"""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'rb') as manifest:
+            manifest.seek(self._manifest_offset)
+            for line in manifest:
+                if not line.endswith(b'\n'):
+                    break  # строка еще дописывается
+                self._manifest_offset += len(line)
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                self._entries.setdefault(entry['file_id'], {}).update(entry)
+
+    def add(self, file_id: str, **fields):
+        """Регистрирует файлы загрузки: add(file_id, original=..., thumbnail=..., format=...)"""
+        entry = {'file_id': file_id, **fields}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as manifest:
+                manifest.write(line)
+            self._entries.setdefault(file_id, {}).update(entry)
+
+    def register(self, image_info: dict):
+        """Регистрирует результат image_pipeline.process_image (file_id - хэш содержимого)"""
+        fields = {name: value for name, value in image_info.items() if name not in ('file_id', 'timings')}
+        self.add(image_info['file_id'], content_hash=image_info['file_id'], **fields)
+
+    def get(self, file_id: str):
+        """Запись индекса по file_id или None"""
+        entry = self._entries.get(file_id)
+        if entry is None:
+            with self._lock:
+                self._read_manifest()
+                entry = self._entries.get(file_id)
+        return entry
+
+    def etag(self, file_id: str, rendition: str):
+        """Хэш содержимого файла рендишена; для старых загрузок считается один раз и сохраняется"""
+        entry = self.get(file_id)
+        if not entry or not entry.get(rendition):
+            return None
+        digest = entry.get(f"{rendition}_hash")
+        if digest is None:
+            hasher = hashlib.sha256()
+            with self.storage.open(entry[rendition]) as source:
+                for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            self.add(file_id, **{f"{rendition}_hash": digest})
+        return digest
+
+    def entries(self):
+        """Снимок всех записей (file_id, entry)"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def path(self, file_id: str, rendition: str):
+        """Путь к файлу рендишена ('original', 'thumbnail') или None"""
+        entry = self.get(file_id)
+        if not entry or not entry.get(rendition):
+            return None
+        return self.storage.path(entry[rendition])
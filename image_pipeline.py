@@ -0,0 +1,237 @@
+import io
+import logging
+import time
+
+from PIL import Image, features
+
+from storage import content_hash
+
+logger = logging.getLogger('image_pipeline')
+
+SUPPORTED_FORMATS = ['JPEG', 'PNG', 'GIF', 'WEBP']
+SLOW_PROCESSING_SECONDS = 10  # Дольше - предупреждение в лог (этапы - в image_pipeline_stage_seconds)
+
+# Дополнительные кодировки превью по убыванию эффективности (если их поддерживает сборка Pillow)
+VARIANT_FORMATS = [variant for variant in ('avif', 'webp') if features.check(variant)]
+
+MIMETYPES = {
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+
+
+def check_header(image, max_dimension: int, max_pixels: int):
+    """Проверки по заголовку - до любого декодирования пикселей"""
+    width, height = image.size
+
+    if width > max_dimension or height > max_dimension:
+        return f"Image dimensions too large (max {max_dimension}x{max_dimension})"
+
+    if width * height > max_pixels:
+        return f"Image has too many pixels (max {max_pixels // 1000000} megapixels)"
+
+    if image.format not in SUPPORTED_FORMATS:
+        return "Unsupported image format"
+
+    return None
+
+
+def inspect_image(data: bytes, max_dimension: int, max_pixels: int):
+    """Быстрая проверка загрузки по заголовку: формат и размеры"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            error = check_header(image, max_dimension, max_pixels)
+            info = {'format': image.format.lower() if image.format else None,
+                    'width': image.width, 'height': image.height}
+    except Exception as e:
+        return None, f"Image processing error: {str(e)}"
+
+    if error:
+        return None, error
+    return info, None
+
+
+def thumbnail_size_for(width: int, height: int):
+    """🔥 ДИНАМИЧЕСКОЕ РАЗРЕШЕНИЕ ДЛЯ ПРЕВЬЮ на основе размера оригинала"""
+    if width > 2000 or height > 2000:
+        return (800, 800)
+    elif width > 1000 or height > 1000:
+        return (1200, 1200)
+    return (min(width, 1600), min(height, 1600))
+
+
+def encode_image(image, image_format: str, quality: int) -> bytes:
+    """Кодирует изображение; для форматов без прозрачности подкладывает белый фон"""
+    buffer = io.BytesIO()
+    if image_format == 'PNG':
+        image.save(buffer, image_format)
+    else:
+        if image_format == 'JPEG' and image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA') if image.mode != 'RGBA' else image
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        image.save(buffer, image_format, optimize=True, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_variant(image, variant: str) -> bytes:
+    """Кодирует превью в WebP/AVIF для клиентов, которые их принимают"""
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    buffer = io.BytesIO()
+    if variant == 'avif':
+        image.save(buffer, 'AVIF', quality=60, speed=8)
+    else:
+        image.save(buffer, 'WEBP', quality=75, method=4)
+    return buffer.getvalue()
+
+
+def decode_for_thumbnail(data: bytes, size):
+    """Декодирует пиксели в наименьшем масштабе, достаточном для превью size.
+
+    JPEG через draft() распаковывается в 1/2-1/8 масштаба прямо в декодере,
+    остальные форматы декодируются в исходном размере.
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.format == 'JPEG':
+        image.draft('RGB', (size[0] * 2, size[1] * 2))
+    image.load()
+    return image
+
+
+def resize_thumbnail(image, size):
+    """Уменьшает декодированное изображение до превью на месте.
+
+    Сначала грубо ужимает reduce() (reducing_gap), и только потом применяется
+    LANCZOS. Полноразмерная копия не создается.
+    """
+    image.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return image
+
+
+def render_width(data: bytes, width: int, variant: str = None) -> bytes:
+    """Рендишен заданной ширины (с сохранением пропорций, без увеличения).
+
+    variant - 'webp'/'avif', иначе рендишен кодируется в формате источника.
+    """
+    with Image.open(io.BytesIO(data)) as probe:
+        source_format = probe.format
+        source_width, source_height = probe.size
+
+    width = min(width, source_width)
+    height = max(1, round(source_height * width / source_width))
+    image = Image.open(io.BytesIO(data))
+    if image.format == 'JPEG':
+        image.draft('RGB', (width * 2, height * 2))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    image.close()
+    if variant:
+        encoded = encode_variant(resized, variant)
+    else:
+        encoded = encode_image(resized, source_format, quality=80)
+    resized.close()
+    return encoded
+
+
+def transcode(data: bytes, variant: str) -> bytes:
+    """Перекодирует готовое превью в другой формат без изменения размера"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        return encode_variant(image, variant)
+
+
+def process_image(data: bytes, file_id: str, storage, max_dimension: int, max_pixels: int,
+                  reencode_original: bool = False):
+    """Рендишены загрузки: оригинал (как есть) и превью с динамическим разрешением.
+
+    Общий пайплайн для сервера (выполняется в рабочем процессе jobs.ImageJobQueue)
+    и для seed-скриптов, поэтому принимает только сериализуемые аргументы.
+    Длительности этапов возвращаются в 'timings' (секунды) - метрики считает
+    процесс сервера, рабочий процесс только измеряет.
+    """
+    try:
+        start_time = time.time()
+        timings = {}
+        stage_started = time.perf_counter()
+
+        def stage(name):
+            nonlocal stage_started
+            now = time.perf_counter()
+            timings[name] = timings.get(name, 0.0) + now - stage_started
+            stage_started = now
+
+        # Заголовок читается без декодирования пикселей
+        image = Image.open(io.BytesIO(data))
+        error = check_header(image, max_dimension, max_pixels)
+        if error:
+            return None, error
+        stage('header')
+
+        source_format = image.format
+        width, height = image.size
+        extension = source_format.lower()
+
+        original_key = storage.object_key(file_id, extension)
+        thumbnail_key = storage.object_key(file_id, extension, 'thumbnail')
+
+        # Оригинал пишется байт в байт; перекодируем только по запросу
+        if reencode_original:
+            image.load()
+            stage('decode')
+            original_data = encode_image(image, source_format, quality=85)
+            stage('encode')
+        else:
+            original_data = data
+        storage.save(original_key, original_data)
+        image.close()
+        stage('original_save')
+
+        # Пиксели декодируются здесь же, сразу в уменьшенном масштабе
+        thumbnail_size = thumbnail_size_for(width, height)
+        thumbnail_image = decode_for_thumbnail(data, thumbnail_size)
+        stage('decode')
+        resize_thumbnail(thumbnail_image, thumbnail_size)
+        stage('thumbnail_resize')
+        thumbnail_data = encode_image(thumbnail_image, source_format, quality=80)
+        stage('encode')
+        storage.save(thumbnail_key, thumbnail_data)
+        stage('thumbnail_save')
+
+        # Варианты превью для согласования по Accept (AVIF > WebP > формат оригинала)
+        variants = {}
+        for variant in VARIANT_FORMATS:
+            if variant == extension:
+                continue
+            variant_data = encode_variant(thumbnail_image, variant)
+            stage('encode')
+            variant_key = storage.object_key(file_id, variant, 'thumbnail')
+            storage.save(variant_key, variant_data)
+            stage('thumbnail_save')
+            variants[f"thumbnail_{variant}"] = variant_key
+            variants[f"thumbnail_{variant}_hash"] = content_hash(variant_data)
+        thumbnail_image.close()
+
+        processing_time = time.time() - start_time
+        if processing_time > SLOW_PROCESSING_SECONDS:
+            logger.warning("Slow image processing: %.2fs, size: %dx%d, stages: %s",
+                           processing_time, width, height,
+                           {name: round(seconds, 3) for name, seconds in timings.items()})
+
+        return {
+            'original': original_key,
+            'thumbnail': thumbnail_key,
+            'format': extension,
+            'file_id': file_id,
+            # Хэши содержимого файлов - сильные ETag для HTTP-кэширования
+            'original_hash': file_id if original_data is data else content_hash(original_data),
+            'thumbnail_hash': content_hash(thumbnail_data),
+            **variants,
+            'timings': timings
+        }, None
+
+    except Exception as e:
+        return None, f"Image processing error: {str(e)}"
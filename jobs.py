@@ -0,0 +1,144 @@
+import atexit
+import multiprocessing
+import queue
+import threading
+import traceback
+
+
+class QueueFull(Exception):
+    """Очередь обработки переполнена - клиенту стоит повторить позже"""
+
+
+def _worker_main(connection):
+    """Цикл рабочего процесса: получает (func, args), возвращает (результат, ошибка)"""
+    connection.send('ready')
+    while True:
+        try:
+            task = connection.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        func, args = task
+        try:
+            connection.send((func(*args), None))
+        except Exception as e:
+            connection.send((None, f"Processing error: {str(e)}"))
+
+
+class _Job:
+    __slots__ = ('func', 'args', 'callback')
+
+    def __init__(self, func, args, callback):
+        self.func = func
+        self.args = args
+        self.callback = callback
+
+
+class ImageJobQueue:
+    """Ограниченный пул процессов для обработки изображений.
+
+    Каждый из max_workers потоков-диспетчеров держит свой рабочий процесс
+    (PIL работает вне GIL основного процесса). Если задача не уложилась в
+    timeout, процесс убивается и заменяется новым - обработка действительно
+    прекращается, а не продолжает есть CPU и память в фоне.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._context = multiprocessing.get_context('spawn')
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, func, args, callback):
+        """Ставит func(*args) в очередь; callback(result, error) вызывается в потоке диспетчера"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(_Job(func, args, callback))
+        except queue.Full:
+            raise QueueFull("Image processing queue is full")
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads or self._closed:
+                return
+            for number in range(self.max_workers):
+                thread = threading.Thread(target=self._dispatch, name=f"image-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.shutdown)
+
+    def _spawn(self):
+        """Запускает рабочий процесс и ждет его готовности (время старта не входит в timeout)"""
+        parent_connection, child_connection = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        process.start()
+        child_connection.close()
+        parent_connection.recv()
+        return process, parent_connection
+
+    def _kill(self, process, connection):
+        connection.close()
+        process.kill()
+        process.join()
+
+    def _run_job(self, worker, job):
+        """Выполняет задачу в рабочем процессе; возвращает (worker, result, error)"""
+        if worker is None:
+            worker = self._spawn()
+        process, connection = worker
+        try:
+            connection.send((job.func, job.args))
+            if connection.poll(self.timeout):
+                result, error = connection.recv()
+                return worker, result, error
+            error = "Image processing timeout - file too large or complex"
+        except (EOFError, OSError):
+            # Рабочий процесс упал (например, OOM)
+            error = "Image processing worker crashed"
+        self._kill(process, connection)
+        return None, None, error
+
+    def _dispatch(self):
+        worker = None
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            try:
+                worker, result, error = self._run_job(worker, job)
+            except Exception as e:
+                traceback.print_exc()
+                result, error = None, f"Processing error: {str(e)}"
+
+            try:
+                job.callback(result, error)
+            except Exception:
+                traceback.print_exc()
+
+        if worker is not None:
+            self._kill(*worker)
+
+    def shutdown(self):
+        """Останавливает диспетчеры и рабочие процессы (задачи в очереди отбрасываются)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=self.timeout)
@@ -0,0 +1,321 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from flask import Flask, g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Shard:
+    """Значения одного потока: пишет только владелец, поэтому без блокировок"""
+    __slots__ = ('counters', 'gauges', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}  # key -> [по бакетам..., +Inf, сумма]
+
+    def merge_into(self, counters: dict, gauges: dict, histograms: dict):
+        """Прибавляет значения шарда к итогам (list(dict.items()) атомарен под GIL)"""
+        for key, value in list(self.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, value in list(self.gauges.items()):
+            gauges[key] = gauges.get(key, 0) + value
+        for key, counts in list(self.histograms.items()):
+            total = histograms.setdefault(key, [0] * len(counts))
+            for position, count in enumerate(list(counts)):
+                total[position] += count
+
+
+class _ShardOwner:
+    """Держатель шарда в threading.local: исчезает вместе с потоком, что и отслеживает finalize"""
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard: _Shard):
+        self.shard = shard
+
+
+class MetricsRegistry:
+    """Счетчики, гистограммы и gauge в формате Prometheus.
+
+    Каждый поток пишет в свой шард (блокировка берется только при создании
+    шарда), шарды складываются при сборе. Шард завершившегося потока
+    вливается в общий итог _retired_total, так что шардов не больше, чем
+    живых потоков, писавших метрики. Если задан directory, процесс раз в
+    flush_interval секунд сбрасывает свой снимок в <directory>/<pid>.json, а
+    сборка читает снимки всех рабочих процессов - так /api/metrics отдает
+    сумму по всем воркерам, какой бы из них ни обработал запрос.
+    """
+
+    def __init__(self, directory: str = None, flush_interval: float = 5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._definitions = {}  # name -> (type, help, buckets)
+        self._local = threading.local()
+        self._shards = set()  # Шарды живых потоков
+        self._retired = []  # Шарды завершившихся потоков, еще не влитые в итог
+        self._retired_total = _Shard()
+        self._lock = threading.Lock()
+        self._samplers = []
+        self._flusher = None
+
+    # Описание метрик
+    def counter(self, name: str, help_text: str):
+        self._definitions[name] = ('counter', help_text, None)
+
+    def gauge(self, name: str, help_text: str):
+        self._definitions[name] = ('gauge', help_text, None)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self._definitions[name] = ('histogram', help_text, tuple(buckets))
+
+    def add_sampler(self, sampler):
+        """sampler() -> [(name, labels, value)] - gauge, которые считываются в момент сбора"""
+        self._samplers.append(sampler)
+
+    # Запись
+    def _shard(self) -> _Shard:
+        owner = getattr(self._local, 'owner', None)
+        if owner is None:
+            owner = self._local.owner = _ShardOwner(_Shard())
+            # threading.local освобождает owner при завершении потока; finalize только
+            # откладывает шард (без блокировки - он может сработать где угодно)
+            weakref.finalize(owner, self._retired.append, owner.shard)
+            with self._lock:
+                self._fold_retired()
+                self._shards.add(owner.shard)
+        return owner.shard
+
+    def _fold_retired(self):
+        """Вливает шарды завершившихся потоков в _retired_total (вызывать под self._lock)"""
+        total = self._retired_total
+        while self._retired:
+            shard = self._retired.pop()
+            shard.merge_into(total.counters, total.gauges, total.histograms)
+            self._shards.discard(shard)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        counters = self._shard().counters
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+
+    def gauge_add(self, name: str, value: float, **labels):
+        gauges = self._shard().gauges
+        key = (name, tuple(sorted(labels.items())))
+        gauges[key] = gauges.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._definitions[name][2]
+        histograms = self._shard().histograms
+        key = (name, tuple(sorted(labels.items())))
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    # Сбор
+    def snapshot(self) -> dict:
+        """Сумма шардов этого процесса и итога завершившихся потоков"""
+        counters, gauges, histograms = {}, {}, {}
+        # Под блокировкой: шард не должен влиться в итог, пока мы его уже посчитали
+        with self._lock:
+            self._fold_retired()
+            self._retired_total.merge_into(counters, gauges, histograms)
+            for shard in self._shards:
+                shard.merge_into(counters, gauges, histograms)
+        for sampler in self._samplers:
+            for name, labels, value in sampler():
+                key = (name, tuple(sorted(labels.items())))
+                gauges[key] = gauges.get(key, 0) + value
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def flush(self):
+        """Пишет снимок процесса в directory (атомарно, через временный файл)"""
+        if not self.directory:
+            return
+        snapshot = self.snapshot()
+        payload = {
+            'pid': os.getpid(),
+            **{kind: [[name, list(labels), value] for (name, labels), value in values.items()]
+               for kind, values in snapshot.items()},
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        target = os.path.join(self.directory, f"{os.getpid()}.json")
+        temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as temp_file:
+            json.dump(payload, temp_file)
+        os.replace(temp_path, target)
+
+    def start_flusher(self):
+        if not self.directory or self._flusher:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        self._flusher = threading.Thread(target=loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def collect(self) -> dict:
+        """Снимок этого процесса плюс снимки остальных воркеров из directory"""
+        merged = self.snapshot()
+        if not self.directory or not os.path.isdir(self.directory):
+            return merged
+
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding='utf-8') as snapshot_file:
+                    payload = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(payload.get('pid'))
+            for kind in ('counters', 'gauges', 'histograms'):
+                # gauge завершившегося процесса (in-flight, пул) уже неактуальны; счетчики остаются
+                if kind == 'gauges' and not alive:
+                    continue
+                for name, labels, value in payload.get(kind, []):
+                    key = (name, tuple(tuple(pair) for pair in labels))
+                    if kind == 'histograms':
+                        total = merged[kind].setdefault(key, [0] * len(value))
+                        for position, count in enumerate(value):
+                            total[position] += count
+                    else:
+                        merged[kind][key] = merged[kind].get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4"""
+        collected = self.collect()
+        lines = []
+        for name, (metric_type, help_text, buckets) in sorted(self._definitions.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'histogram':
+                for (metric, labels), counts in sorted(collected['histograms'].items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {counts[-1]}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+            else:
+                values = collected['counters' if metric_type == 'counter' else 'gauges']
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _process_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metrics:
+    """HTTP-метрики приложения поверх MetricsRegistry (роут /api/metrics - в web_server)"""
+
+    def __init__(self, app: Flask = None, **kwargs):
+        if app:
+            self.init_app(app, **kwargs)
+
+    def init_app(self, app: Flask, image_endpoints=(), engine=None):
+        self.registry = registry = MetricsRegistry(app.config.get('METRICS_DIR'),
+                                                   app.config.get('METRICS_FLUSH_INTERVAL', 5))
+        self.image_endpoints = set(image_endpoints)
+
+        registry.counter('http_requests_total', "HTTP requests by route, method and status")
+        registry.histogram('http_request_duration_seconds', "HTTP request latency by route and method")
+        registry.gauge('http_requests_in_flight', "HTTP requests being handled right now")
+        registry.counter('image_bytes_served_total', "Bytes sent by image routes")
+        registry.histogram('image_pipeline_stage_seconds', "Upload processing time by stage", STAGE_BUCKETS)
+        registry.counter('image_uploads_processed_total', "Processed uploads by result")
+        if engine is not None:
+            registry.gauge('db_pool_connections', "Database pool connections by state")
+            registry.add_sampler(lambda: _pool_samples(engine))
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        registry.start_flusher()
+        app.extensions['metrics'] = self
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter()
+        self.registry.gauge_add('http_requests_in_flight', 1)
+
+    def _finish_request(self, response):
+        started = g.get('_metrics_started')
+        if started is None:
+            return response
+        # Шаблон роута, а не путь: иначе по метке на каждый ID
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.registry.inc('http_requests_total', route=route, method=request.method,
+                          status=str(response.status_code))
+        self.registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                              route=route, method=request.method)
+        if request.endpoint in self.image_endpoints and response.content_length:
+            self.registry.inc('image_bytes_served_total', response.content_length, route=route)
+        return response
+
+    def _teardown_request(self, exception):
+        if g.pop('_metrics_started', None) is not None:
+            self.registry.gauge_add('http_requests_in_flight', -1)
+
+    def record_upload(self, image_info, error):
+        """Итог обработки загрузки и длительности этапов из image_pipeline.process_image"""
+        self.registry.inc('image_uploads_processed_total', result='failed' if error else 'ready')
+        for stage, seconds in ((image_info or {}).get('timings') or {}).items():
+            self.registry.observe('image_pipeline_stage_seconds', seconds, stage=stage)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def _pool_samples(engine):
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return []
+    samples = [('db_pool_connections', {'state': 'checked_out'}, pool.checkedout())]
+    if hasattr(pool, 'checkedin'):
+        samples.append(('db_pool_connections', {'state': 'idle'}, pool.checkedin()))
+    if hasattr(pool, 'overflow'):
+        samples.append(('db_pool_connections', {'state': 'overflow'}, max(pool.overflow(), 0)))
+    if hasattr(pool, 'size'):
+        samples.append(('db_pool_connections', {'state': 'size'}, pool.size()))
+    return samples
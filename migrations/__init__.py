@@ -0,0 +1,245 @@
+"""Версионированные миграции схемы базы.
+
+Миграция - модуль vNNN_<название>.py с функциями upgrade(context) и
+downgrade(context), номер версии - NNN. Примененная версия хранится в таблице
+schema_version. Сервер при старте только сверяет ее с последней миграцией
+(check), схему меняет CLI:
+
+    python -m migrations upgrade [версия]
+    python -m migrations downgrade <версия>
+    python -m migrations current
+
+Миграции пишутся идемпотентно (IF NOT EXISTS, проверка колонок), поэтому база,
+созданная до появления schema_version, обновляется с версии 0 без ошибок.
+Модуль с TRANSACTIONAL = False выполняется без общей транзакции: индексы в
+PostgreSQL строятся CONCURRENTLY, заполнение колонок коммитится пачками.
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, inspect, text
+
+VERSION_TABLE = 'schema_version'
+BATCH_SIZE = 5000
+_MODULE_NAME = re.compile(r'^v(\d+)_\w+$')
+
+
+class Migration:
+    __slots__ = ('version', 'name', 'module')
+
+    def __init__(self, version: int, name: str, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, 'TRANSACTIONAL', True)
+
+    @property
+    def description(self) -> str:
+        return (self.module.__doc__ or self.name).strip().splitlines()[0]
+
+
+class MigrationContext:
+    """То, с чем работает миграция: соединение и идемпотентные операции над схемой"""
+
+    def __init__(self, connection, transactional: bool, batch_size: int = BATCH_SIZE, log=print):
+        self.connection = connection
+        self.transactional = transactional
+        self.batch_size = batch_size
+        self.log = log
+
+    @property
+    def dialect(self) -> str:
+        return self.connection.dialect.name
+
+    def execute(self, statement: str, params: dict = None):
+        return self.connection.execute(text(statement), params or {})
+
+    # Инспектор каждый раз новый: схема меняется по ходу миграции
+    def has_table(self, table: str) -> bool:
+        return inspect(self.connection).has_table(table)
+
+    def columns(self, table: str) -> set:
+        return {column['name'] for column in inspect(self.connection).get_columns(table)}
+
+    def indexes(self, table: str) -> set:
+        return {index['name'] for index in inspect(self.connection).get_indexes(table)}
+
+    def add_column(self, table: str, name: str, definition: str) -> bool:
+        """ALTER TABLE ADD COLUMN, если колонки нет; True - колонка добавлена сейчас"""
+        if name in self.columns(table):
+            return False
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+        return True
+
+    def drop_column(self, table: str, name: str):
+        if name in self.columns(table):
+            self.execute(f"ALTER TABLE {table} DROP COLUMN {name}")
+
+    def create_index(self, name: str, table: str, columns, unique: bool = False):
+        """CREATE INDEX, если его нет. В PostgreSQL вне транзакции - CONCURRENTLY, без блокировки записи"""
+        if name in self.indexes(table):
+            return
+        online = 'CONCURRENTLY ' if self.dialect == 'postgresql' and not self.transactional else ''
+        self.log(f"   🔨 {name}")
+        self.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {online}{name} ON {table} ({', '.join(columns)})")
+
+    def drop_index(self, name: str):
+        online = 'CONCURRENTLY ' if self.dialect == 'postgresql' and not self.transactional else ''
+        self.execute(f"DROP INDEX {online}IF EXISTS {name}")
+
+    def backfill(self, table: str, assignment: str, key: str = 'id'):
+        """UPDATE table SET assignment пачками по диапазонам key.
+
+        Вне транзакции каждая пачка коммитится сразу, поэтому блокировка записи
+        держится недолго и сервер продолжает работать во время заполнения.
+        """
+        total = 0
+        last = None
+        while True:
+            after = f"WHERE {key} > :last " if last is not None else ""
+            keys = self.execute(
+                f"SELECT {key} FROM {table} {after}ORDER BY {key} LIMIT :limit",
+                {'last': last, 'limit': self.batch_size}
+            ).scalars().all()
+            if not keys:
+                break
+            self.execute(
+                f"UPDATE {table} SET {assignment} WHERE {key} >= :first AND {key} <= :last",
+                {'first': keys[0], 'last': keys[-1]}
+            )
+            total += len(keys)
+            last = keys[-1]
+            self.log(f"   ⏳ {table}: {total}")
+
+
+def load_migrations() -> list:
+    """Все миграции пакета по возрастанию версии"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = _MODULE_NAME.match(module_info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{module_info.name}")
+            migrations.append(Migration(int(match.group(1)), module_info.name, module))
+    migrations.sort(key=lambda migration: migration.version)
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return migrations
+
+
+def head_version() -> int:
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version(connection) -> int:
+    if not inspect(connection).has_table(VERSION_TABLE):
+        return 0
+    return connection.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalar() or 0
+
+
+def _set_version(connection, version: int):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    connection.execute(text(f"DELETE FROM {VERSION_TABLE}"))
+    connection.execute(text(f"INSERT INTO {VERSION_TABLE} (version, applied_at) VALUES (:version, :applied_at)"),
+                       {'version': version, 'applied_at': datetime.utcnow()})
+
+
+def check(engine):
+    """Проверка при старте приложения: версия схемы совпадает с кодом, иначе RuntimeError"""
+    with engine.connect() as connection:
+        version = current_version(connection)
+    head = head_version()
+    if version != head:
+        raise RuntimeError(
+            f"Database schema is at version {version}, the code expects {head}: "
+            f"run python -m migrations upgrade"
+        )
+
+
+def migration_engine(url):
+    """Отдельный движок для миграций.
+
+    pysqlite сам не открывает транзакцию перед DDL, поэтому для SQLite BEGIN
+    выполняется явно - иначе миграция не откатилась бы целиком при ошибке.
+    """
+    if not str(url).startswith('sqlite'):
+        return create_engine(url)
+
+    engine = create_engine(url, connect_args={'timeout': 30})
+
+    @event.listens_for(engine, 'connect')
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        if connection.get_execution_options().get('isolation_level') != 'AUTOCOMMIT':
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    return engine
+
+
+def _run(engine, migration, direction: str, version_after: int, log):
+    log(f"{'⬆️' if direction == 'upgrade' else '⬇️'} {migration.version:03d} {migration.description}")
+    step = getattr(migration.module, direction)
+    if migration.transactional:
+        with engine.begin() as connection:
+            step(MigrationContext(connection, True, log=log))
+            _set_version(connection, version_after)
+    else:
+        with engine.connect() as connection:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+            step(MigrationContext(connection, False, log=log))
+            _set_version(connection, version_after)
+
+
+def upgrade(url, target: int = None, log=print) -> int:
+    """Применяет миграции до target (по умолчанию - до последней); возвращает новую версию"""
+    engine = migration_engine(url)
+    try:
+        with engine.connect() as connection:
+            version = current_version(connection)
+        for migration in load_migrations():
+            if migration.version <= version or (target is not None and migration.version > target):
+                continue
+            _run(engine, migration, 'upgrade', migration.version, log)
+            version = migration.version
+        return version
+    finally:
+        engine.dispose()
+
+
+def downgrade(url, target: int, log=print) -> int:
+    """Откатывает миграции с версией больше target; возвращает новую версию"""
+    engine = migration_engine(url)
+    try:
+        with engine.connect() as connection:
+            version = current_version(connection)
+        migrations = load_migrations()
+        for position in range(len(migrations) - 1, -1, -1):
+            migration = migrations[position]
+            if migration.version > version or migration.version <= target:
+                continue
+            previous = migrations[position - 1].version if position else 0
+            _run(engine, migration, 'downgrade', previous, log)
+            version = previous
+        return version
+    finally:
+        engine.dispose()
+
+
+def current(url) -> int:
+    engine = migration_engine(url)
+    try:
+        with engine.connect() as connection:
+            return current_version(connection)
+    finally:
+        engine.dispose()
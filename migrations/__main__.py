@@ -0,0 +1,42 @@
+"""CLI миграций: python -m migrations upgrade|downgrade|current (база - из конфигурации приложения)"""
+import argparse
+
+import migrations
+from models import db
+from web_server import create_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m migrations', description="Database schema migrations")
+    commands = parser.add_subparsers(dest='command', required=True)
+    upgrade = commands.add_parser('upgrade', help="apply migrations up to VERSION (default: latest)")
+    upgrade.add_argument('version', type=int, nargs='?')
+    downgrade = commands.add_parser('downgrade', help="revert migrations above VERSION")
+    downgrade.add_argument('version', type=int)
+    commands.add_parser('current', help="show the applied and the latest version")
+    parser.add_argument('--database', help="SQLALCHEMY_DATABASE_URI (default: app config)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    overrides = {'DB_SCHEMA_CHECK': False}
+    if args.database:
+        overrides['SQLALCHEMY_DATABASE_URI'] = args.database
+    app = create_app(overrides)
+    with app.app_context():
+        # URL уже с абсолютным путем к SQLite-файлу в instance/
+        url = db.engine.url
+        db.engine.dispose()
+
+    if args.command == 'upgrade':
+        version = migrations.upgrade(url, args.version)
+    elif args.command == 'downgrade':
+        version = migrations.downgrade(url, args.version)
+    else:
+        version = migrations.current(url)
+    print(f"📦 Версия схемы: {version} (последняя: {migrations.head_version()})")
+
+
+if __name__ == "__main__":
+    main()
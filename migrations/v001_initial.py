@@ -0,0 +1,38 @@
+"""Начальная схема: аккаунты, арты, покупки (строковые UUID-ключи)"""
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text
+
+# Схема на момент миграции, независимо от текущих моделей
+metadata = MetaData()
+Table(
+    'accounts', metadata,
+    Column('id', String(36), primary_key=True),
+    Column('nickname', String(80), unique=True, nullable=False),
+    Column('mail', String(120), unique=True, nullable=False),
+    Column('password', String(120), nullable=False),
+    Column('created_at', DateTime),
+)
+Table(
+    'products', metadata,
+    Column('id', String(36), primary_key=True),
+    Column('photo_url', String(500), nullable=False),
+    Column('creator_id', String(36), ForeignKey('accounts.id'), nullable=False),
+    Column('title', String(200), nullable=False),
+    Column('price', Integer, nullable=False),
+    Column('description', Text),
+    Column('updated_at', DateTime),
+)
+Table(
+    'purchases', metadata,
+    Column('id', String(36), primary_key=True),
+    Column('account_id', String(36), ForeignKey('accounts.id'), nullable=False),
+    Column('product_id', String(36), ForeignKey('products.id'), nullable=False),
+    Column('purchased_at', DateTime),
+)
+
+
+def upgrade(context):
+    metadata.create_all(context.connection, checkfirst=True)
+
+
+def downgrade(context):
+    metadata.drop_all(context.connection, checkfirst=True)
@@ -0,0 +1,22 @@
+"""Счетчик покупателей, статус обработки изображения, длинные хэши паролей"""
+
+TRANSACTIONAL = False  # buyers_count заполняется пачками
+
+RECOUNT_BUYERS = "buyers_count = (SELECT COUNT(*) FROM purchases WHERE purchases.product_id = products.id)"
+
+
+def upgrade(context):
+    # scrypt-хэш werkzeug длиннее 120 символов; SQLite длину VARCHAR не проверяет
+    if context.dialect == 'postgresql':
+        context.execute("ALTER TABLE accounts ALTER COLUMN password TYPE VARCHAR(256)")
+
+    context.add_column('products', 'status', "VARCHAR(20) DEFAULT 'ready' NOT NULL")
+    context.add_column('products', 'processing_error', "TEXT")
+    if context.add_column('products', 'buyers_count', "INTEGER DEFAULT '0' NOT NULL"):
+        context.backfill('products', RECOUNT_BUYERS)
+
+
+def downgrade(context):
+    # Ширину password не сужаем: существующие хэши в VARCHAR(120) не поместятся
+    for column in ('buyers_count', 'processing_error', 'status'):
+        context.drop_column('products', column)
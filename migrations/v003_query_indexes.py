@@ -0,0 +1,24 @@
+"""Индексы ленты, профиля и покупателей"""
+
+TRANSACTIONAL = False  # PostgreSQL: CREATE INDEX CONCURRENTLY
+
+INDEXES = (
+    # Лента: ORDER BY updated_at DESC, id DESC и seek-пагинация по (updated_at, id)
+    ('ix_products_updated_at_id', 'products', ('updated_at', 'id')),
+    # Товары автора в профиле
+    ('ix_products_creator_id_updated_at_id', 'products', ('creator_id', 'updated_at', 'id')),
+    # Последние покупатели товара
+    ('ix_purchases_product_id_purchased_at', 'purchases', ('product_id', 'purchased_at')),
+    # Покупки в профиле
+    ('ix_purchases_account_id_purchased_at_id', 'purchases', ('account_id', 'purchased_at', 'id')),
+)
+
+
+def upgrade(context):
+    for name, table, columns in INDEXES:
+        context.create_index(name, table, columns)
+
+
+def downgrade(context):
+    for name, _, _ in reversed(INDEXES):
+        context.drop_index(name)
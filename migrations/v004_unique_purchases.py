@@ -0,0 +1,26 @@
+"""Одна покупка товара на аккаунт (уникальный индекс account_id, product_id)"""
+from migrations.v002_product_state import RECOUNT_BUYERS
+
+TRANSACTIONAL = False
+
+INDEX = 'uq_purchases_account_id_product_id'
+
+# Оставляем самую раннюю из повторных покупок
+DELETE_DUPLICATES = (
+    "DELETE FROM purchases WHERE EXISTS (SELECT 1 FROM purchases AS earlier "
+    "WHERE earlier.account_id = purchases.account_id AND earlier.product_id = purchases.product_id "
+    "AND (earlier.purchased_at < purchases.purchased_at "
+    "OR (earlier.purchased_at = purchases.purchased_at AND earlier.id < purchases.id)))"
+)
+
+
+def upgrade(context):
+    if INDEX in context.indexes('purchases'):
+        return
+    if context.execute(DELETE_DUPLICATES).rowcount:
+        context.backfill('products', RECOUNT_BUYERS)
+    context.create_index(INDEX, 'purchases', ('account_id', 'product_id'), unique=True)
+
+
+def downgrade(context):
+    context.drop_index(INDEX)
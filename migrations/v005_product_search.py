@@ -0,0 +1,36 @@
+"""Полнотекстовый индекс products_fts (SQLite FTS5) с триггерами синхронизации"""
+
+TABLE = 'products_fts'
+
+# Внешнее содержимое: тексты не дублируются, строки связаны с products по rowid
+SCHEMA = (
+    f"CREATE VIRTUAL TABLE {TABLE} USING fts5(title, description, content='products', "
+    "content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER {TABLE}_ai AFTER INSERT ON products BEGIN "
+    f"INSERT INTO {TABLE}(rowid, title, description) VALUES (new.rowid, new.title, new.description); END",
+    f"CREATE TRIGGER {TABLE}_ad AFTER DELETE ON products BEGIN "
+    f"INSERT INTO {TABLE}({TABLE}, rowid, title, description) "
+    "VALUES ('delete', old.rowid, old.title, old.description); END",
+    f"CREATE TRIGGER {TABLE}_au AFTER UPDATE OF title, description ON products BEGIN "
+    f"INSERT INTO {TABLE}({TABLE}, rowid, title, description) "
+    "VALUES ('delete', old.rowid, old.title, old.description); "
+    f"INSERT INTO {TABLE}(rowid, title, description) VALUES (new.rowid, new.title, new.description); END",
+    # Заполнение по уже существующим товарам
+    f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')",
+)
+
+
+def upgrade(context):
+    # В остальных СУБД поиск работает через LIKE (DatabaseManager.search_product_rows)
+    if context.dialect != 'sqlite' or context.has_table(TABLE):
+        return
+    for statement in SCHEMA:
+        context.execute(statement)
+
+
+def downgrade(context):
+    if context.dialect != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        context.execute(f"DROP TRIGGER IF EXISTS {TABLE}_{suffix}")
+    context.execute(f"DROP TABLE IF EXISTS {TABLE}")
@@ -0,0 +1,20 @@
+"""Индексы каталога для ?sort=price|popular, в том числе с ?creator="""
+
+TRANSACTIONAL = False  # PostgreSQL: CREATE INDEX CONCURRENTLY
+
+INDEXES = (
+    ('ix_products_price_id', 'products', ('price', 'id')),
+    ('ix_products_buyers_count_id', 'products', ('buyers_count', 'id')),
+    ('ix_products_creator_id_price_id', 'products', ('creator_id', 'price', 'id')),
+    ('ix_products_creator_id_buyers_count_id', 'products', ('creator_id', 'buyers_count', 'id')),
+)
+
+
+def upgrade(context):
+    for name, table, columns in INDEXES:
+        context.create_index(name, table, columns)
+
+
+def downgrade(context):
+    for name, _, _ in reversed(INDEXES):
+        context.drop_index(name)
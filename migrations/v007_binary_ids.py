@@ -0,0 +1,121 @@
+"""UUID-ключи в 16 байтах вместо String(36) (models.BinaryUUID)
+
+Значения ключей не меняются, поэтому ссылки, курсоры и выданные токены
+продолжают работать. SQLite не умеет менять тип колонки: таблицы пересоздаются
+с исходным DDL, где меняется только тип ключевых колонок, строки переносятся
+пачками с теми же rowid (поисковый индекс products_fts остается валидным),
+индексы и триггеры восстанавливаются. PostgreSQL: ALTER COLUMN ... TYPE bytea.
+Место, освобожденное в SQLite, возвращает VACUUM после миграции.
+"""
+import re
+import uuid
+
+from sqlalchemy import inspect
+
+# Колонки с UUID в каждой таблице, в порядке зависимостей
+ID_COLUMNS = {
+    'accounts': ('id',),
+    'products': ('id', 'creator_id'),
+    'purchases': ('id', 'account_id', 'product_id'),
+}
+STRING_TYPE = 'VARCHAR(36)'
+BINARY_TYPE = 'BLOB'
+
+
+def to_bytes(value):
+    return uuid.UUID(value).bytes if value is not None else None
+
+
+def to_string(value):
+    return str(uuid.UUID(bytes=bytes(value))) if value is not None else None
+
+
+def string_ids(context) -> bool:
+    column = next(column for column in inspect(context.connection).get_columns('accounts')
+                  if column['name'] == 'id')
+    return 'CHAR' in str(column['type']).upper()
+
+
+def rebuild_sqlite(context, from_type: str, to_type: str, convert):
+    """Пересоздает таблицы ID_COLUMNS с новым типом ключевых колонок"""
+    # Переименование не должно переписывать ссылки REFERENCES в других таблицах
+    context.execute("PRAGMA legacy_alter_table = ON")
+    for table, id_columns in ID_COLUMNS.items():
+        table_sql = context.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table", {'table': table}
+        ).scalar()
+        dependents = context.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = :table AND type IN ('index', 'trigger') "
+            "AND sql IS NOT NULL ORDER BY type", {'table': table}
+        ).scalars().all()
+
+        new_sql = re.sub(r'^CREATE TABLE "?\w+"?', f'CREATE TABLE {table}_rebuild', table_sql, count=1)
+        for column in id_columns:
+            new_sql = re.sub(rf'^(\s*"?{column}"?\s+){re.escape(from_type)}', rf'\g<1>{to_type}',
+                             new_sql, count=1, flags=re.MULTILINE)
+        context.execute(new_sql)
+
+        # rowid переносится как есть: на него ссылается products_fts
+        columns = ['rowid'] + [row[1] for row in context.execute(f"PRAGMA table_info({table})")]
+        insert = (f"INSERT INTO {table}_rebuild ({', '.join(columns)}) "
+                  f"VALUES ({', '.join(f':{column}' for column in columns)})")
+        last_rowid, total = 0, 0
+        while True:
+            rows = context.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE rowid > :last ORDER BY rowid LIMIT :limit",
+                {'last': last_rowid, 'limit': context.batch_size}
+            ).mappings().all()
+            if not rows:
+                break
+            context.execute(insert, [
+                {**row, **{column: convert(row[column]) for column in id_columns}} for row in rows
+            ])
+            last_rowid = rows[-1]['rowid']
+            total += len(rows)
+            context.log(f"   ⏳ {table}: {total}")
+
+        context.execute(f"DROP TABLE {table}")
+        context.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+        for statement in dependents:
+            context.execute(statement)
+
+
+def upgrade(context):
+    if not string_ids(context):
+        return  # Ключи уже бинарные (база создана после перехода на BinaryUUID)
+    if context.dialect == 'sqlite':
+        rebuild_sqlite(context, STRING_TYPE, BINARY_TYPE, to_bytes)
+    elif context.dialect == 'postgresql':
+        alter_postgresql(context, "bytea USING decode(replace({column}, '-', ''), 'hex')")
+    else:
+        raise RuntimeError(f"Binary ids migration is not implemented for {context.dialect}")
+
+
+def downgrade(context):
+    if string_ids(context):
+        return
+    if context.dialect == 'sqlite':
+        rebuild_sqlite(context, BINARY_TYPE, STRING_TYPE, to_string)
+    elif context.dialect == 'postgresql':
+        alter_postgresql(context, "varchar(36) USING encode({column}, 'hex')::uuid::text")
+    else:
+        raise RuntimeError(f"Binary ids migration is not implemented for {context.dialect}")
+
+
+def alter_postgresql(context, new_type: str):
+    """Смена типа ключей с пересозданием внешних ключей (они ссылаются на меняемые колонки)"""
+    inspector = inspect(context.connection)
+    foreign_keys = {table: inspector.get_foreign_keys(table) for table in ID_COLUMNS}
+    for table, keys in foreign_keys.items():
+        for key in keys:
+            context.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{key["name"]}"')
+    for table, id_columns in ID_COLUMNS.items():
+        for column in id_columns:
+            context.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {new_type.format(column=column)}")
+    for table, keys in foreign_keys.items():
+        for key in keys:
+            context.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT "{key["name"]}" '
+                f'FOREIGN KEY ({", ".join(key["constrained_columns"])}) '
+                f'REFERENCES {key["referred_table"]} ({", ".join(key["referred_columns"])})'
+            )
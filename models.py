@@ -1,20 +1,95 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import LargeBinary, TypeDecorator
+import os
+import time
 import uuid
 
 db = SQLAlchemy()
 
+# Ширины превью, которые можно запросить через ?w= (и которые попадают в srcset)
+THUMBNAIL_WIDTHS = (160, 320, 480, 640, 960, 1200)
+
+def uuid7(unix_ms: int = None, random_bits: int = None) -> uuid.UUID:
+    """UUIDv7 (RFC 9562): 48 бит времени в миллисекундах, затем случайные биты.
+
+    Новые ключи растут со временем, поэтому вставки идут в конец B-дерева
+    (и первичного ключа, и индексов по creator_id/account_id/product_id),
+    а не в случайные страницы, как у UUIDv4.
+    """
+    if unix_ms is None:
+        unix_ms = time.time_ns() // 1_000_000
+    if random_bits is None:
+        random_bits = int.from_bytes(os.urandom(10), 'big')
+    value = (unix_ms & 0xFFFF_FFFF_FFFF) << 80 | random_bits & ((1 << 80) - 1)
+    # Версия 7 и вариант RFC (uuid.UUID(version=...) до Python 3.14 знает только 1-5)
+    value = value & ~(0xF << 76) | 7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
 def generate_uuid():
-    return str(uuid.uuid4())
+    return str(uuid7())
+
+def canonical_uuid(value):
+    """Каноническая запись UUID ('8c1f...-...' в нижнем регистре) или None, если это не UUID.
+
+    BinaryUUID принимает любое написание (верхний регистр, без дефисов), а из
+    базы возвращает каноническое - сравнивать с результатами запросов нужно его.
+    """
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+class BinaryUUID(TypeDecorator):
+    """UUID в 16 байтах вместо строки из 36 символов.
+
+    Для Python-кода и API значение остается строкой '8c1f...-...'. Строка, которая
+    не является UUID (например, мусор из URL), не совпадет ни с одной строкой таблицы.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        try:
+            return uuid.UUID(str(value)).bytes
+        except ValueError:
+            return b''
+    
+    def literal_processor(self, dialect):
+        """Литерал для compile(literal_binds=True), например в EXPLAIN (check_query_plans.py)"""
+        def process(value):
+            data = self.process_bind_param(value, dialect)
+            if dialect.name == 'postgresql':
+                return f"'\\x{data.hex()}'::bytea"
+            return f"X'{data.hex()}'"
+        return process
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
+
+def image_urls(file_id: str):
+    """URL превью и srcset по file_id (общие для моделей и serializers.py)"""
+    base_url = 'http://localhost:5000'
+    thumbnail_url = f"{base_url}/api/images/thumbnail/{file_id}"
+    return {
+        'thumbnail': thumbnail_url,
+        # srcset для <img>: браузер сам выберет нужную ширину
+        'srcset': ', '.join(f"{thumbnail_url}?w={width} {width}w" for width in THUMBNAIL_WIDTHS)
+    }
 
 class Account(db.Model):
     __tablename__ = 'accounts'
     
-    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    id = db.Column(BinaryUUID, primary_key=True, default=generate_uuid)
     nickname = db.Column(db.String(80), unique=True, nullable=False)
     mail = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(120), nullable=False)
+    password = db.Column(db.String(256), nullable=False)  # scrypt-хэш werkzeug длиннее 120 символов
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -30,26 +105,28 @@ class Account(db.Model):
             'createdAt': self.created_at.isoformat() if self.created_at else None
         }
     
-    def to_dict_with_products(self):
-        """Структура с продуктами (для профиля)"""
+    def to_dict_with_products(self, purchases, posted):
+        """Структура с продуктами (для профиля).
+
+        purchases и posted - уже загруженные страницы (см. DatabaseManager.get_account_purchases
+        и get_user_products): здесь связи не трогаются, чтобы не было ленивых запросов.
+        """
         data = self.to_dict()
-        try:
-            # Используем упрощенные версии продуктов чтобы избежать рекурсии
-            data['bayed'] = [self._simplify_product(purchase.product) for purchase in self.purchases]
-            data['posted'] = [self._simplify_product(product) for product in self.posted]
-        except Exception as e:
-            data['bayed'] = []
-            data['posted'] = []
+        # Используем упрощенные версии продуктов чтобы избежать рекурсии
+        data['bayed'] = [self._simplify_product(purchase.product) for purchase in purchases]
+        data['posted'] = [self._simplify_product(product) for product in posted]
         return data
     
     def _simplify_product(self, product):
         """Упрощенное представление продукта без рекурсии"""
         if not product:
             return None
-            
+        
+        image_urls = product.get_image_urls()
         return {
             'id': product.id,
-            'photoUrl': product.get_image_urls()['thumbnail'],
+            'photoUrl': image_urls['thumbnail'],
+            'photoSrcset': image_urls['srcset'],
             'title': product.title,
             'price': product.price,
             'description': product.description or '',
@@ -60,13 +137,34 @@ class Account(db.Model):
 class Product(db.Model):
     __tablename__ = 'products'
     
-    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    __table_args__ = (
+        # Лента: ORDER BY updated_at DESC, id DESC и seek-пагинация по (updated_at, id)
+        db.Index('ix_products_updated_at_id', 'updated_at', 'id'),
+        # Товары автора в профиле: WHERE creator_id = ? ORDER BY updated_at DESC, id DESC
+        db.Index('ix_products_creator_id_updated_at_id', 'creator_id', 'updated_at', 'id'),
+        # Каталог с ?sort=price|popular (в том числе с ?creator= и диапазоном цены):
+        # порядок берется из индекса, без сортировки всей выборки
+        db.Index('ix_products_price_id', 'price', 'id'),
+        db.Index('ix_products_buyers_count_id', 'buyers_count', 'id'),
+        db.Index('ix_products_creator_id_price_id', 'creator_id', 'price', 'id'),
+        db.Index('ix_products_creator_id_buyers_count_id', 'creator_id', 'buyers_count', 'id'),
+    )
+    
+    id = db.Column(BinaryUUID, primary_key=True, default=generate_uuid)
     photo_url = db.Column(db.String(500), nullable=False)  # Теперь хранит file_id
-    creator_id = db.Column(db.String(36), db.ForeignKey('accounts.id'), nullable=False)
+    creator_id = db.Column(BinaryUUID, db.ForeignKey('accounts.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     price = db.Column(db.Integer, nullable=False)
     description = db.Column(db.Text)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Денормализованный счетчик покупок, ведется в create_purchase
+    buyers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Состояние обработки изображения (processing -> ready | failed)
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')
+    processing_error = db.Column(db.Text)
     
     # Relationships
     creator = relationship("Account", back_populates="posted", foreign_keys=[creator_id])
@@ -76,10 +174,7 @@ class Product(db.Model):
     
     def get_image_urls(self):
         """Генерирует URL для изображений"""
-        base_url = 'http://localhost:5000'
-        return {
-            'thumbnail': f"{base_url}/api/images/thumbnail/{self.photo_url}"
-        }
+        return image_urls(self.photo_url)
     
     # def get_image_urls(self):
     #     """Генерирует URL для изображений"""
@@ -96,6 +191,7 @@ class Product(db.Model):
         return {
             'id': self.id,
             'photoUrl': image_urls['thumbnail'],  # По умолчанию показываем превью
+            'photoSrcset': image_urls['srcset'],
             'title': self.title,
             'price': self.price,
             'description': self.description or '',
@@ -103,23 +199,34 @@ class Product(db.Model):
             'creator': self.creator.to_dict() if self.creator else None  # Только базовая информация
         }
     
-    def to_dict_with_buyers(self):
-        """Расширенная структура с информацией о покупателях"""
+    def to_status_dict(self):
+        """Состояние обработки загруженного изображения"""
+        data = {'id': self.id, 'status': self.status}
+        if self.status == self.STATUS_FAILED:
+            data['error'] = self.processing_error
+        return data
+    
+    def to_dict_with_buyers(self, buyers):
+        """Расширенная структура с информацией о покупателях (buyers - уже загруженные аккаунты)"""
         data = self.to_dict()
-        try:
-            data['buyers_count'] = len(self.purchases)
-            data['buyers'] = [purchase.account.to_dict() for purchase in self.purchases]  # Только базовая информация
-        except Exception:
-            data['buyers_count'] = 0
-            data['buyers'] = []
+        data['buyers_count'] = self.buyers_count or 0
+        data['buyers'] = [buyer.to_dict() for buyer in buyers]  # Только базовая информация
         return data
 
 class Purchase(db.Model):
     __tablename__ = 'purchases'
+    __table_args__ = (
+        # Последние покупатели товара: WHERE product_id = ? ORDER BY purchased_at DESC LIMIT n
+        db.Index('ix_purchases_product_id_purchased_at', 'product_id', 'purchased_at'),
+        # Покупки в профиле: WHERE account_id = ? ORDER BY purchased_at DESC, id DESC
+        db.Index('ix_purchases_account_id_purchased_at_id', 'account_id', 'purchased_at', 'id'),
+        # Одна покупка товара на аккаунт: повторы отсекаются ON CONFLICT DO NOTHING
+        db.Index('uq_purchases_account_id_product_id', 'account_id', 'product_id', unique=True),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
-    account_id = db.Column(db.String(36), db.ForeignKey('accounts.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    id = db.Column(BinaryUUID, primary_key=True, default=generate_uuid)
+    account_id = db.Column(BinaryUUID, db.ForeignKey('accounts.id'), nullable=False)
+    product_id = db.Column(BinaryUUID, db.ForeignKey('products.id'), nullable=False)
     purchased_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
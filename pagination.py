@@ -0,0 +1,38 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values):
+    """Упаковывает значения ключа сортировки в непрозрачную строку для ?after="""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str, *types):
+    """Распаковывает курсор обратно в кортеж значений указанных типов.
+
+    Бросает ValueError, если курсор поврежден или не подходит по форме.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(payload, list) or len(payload) != len(types):
+        raise ValueError("Invalid cursor")
+
+    values = []
+    for value, expected in zip(payload, types):
+        if expected is datetime:
+            if not isinstance(value, str):
+                raise ValueError("Invalid cursor")
+            value = datetime.fromisoformat(value)
+        elif expected is float and isinstance(value, int):
+            value = float(value)
+        elif not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError("Invalid cursor")
+        values.append(value)
+    return tuple(values)
@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """Все слоты хэширования заняты - клиенту стоит повторить позже"""
+
+
+class PasswordHasher:
+    """Хэширование паролей в отдельном ограниченном пуле потоков.
+
+    scrypt/pbkdf2 намеренно медленные и считаются в OpenSSL без GIL. Пул и
+    очередь ограничены отдельно от обработки обычных запросов: одновременно
+    считается не больше max_workers хэшей, а всплеск логинов сверх
+    max_workers + max_pending получает HasherBusy (503) через wait_timeout.
+
+    Ограничение: поток запроса не освобождается - он ждет результат
+    (future.result()) все время расчета хэша. Пул ограничивает нагрузку на CPU
+    и число запросов, застрявших на хэшировании, но не возвращает поток
+    серверу раньше; для этого нужен асинхронный сервер или отдельный сервис.
+    """
+
+    def __init__(self, method: str, max_workers: int, max_pending: int, wait_timeout: float):
+        self.method = method
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._method_prefix = None
+
+    def _run(self, func, *args):
+        """Выполняет func в пуле; вызывающий поток блокируется до результата"""
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise HasherBusy("Password hashing is overloaded")
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Хэш посчитан другим алгоритмом или с другими параметрами стоимости"""
+        if self._method_prefix is None:
+            # werkzeug дописывает параметры по умолчанию ("scrypt" -> "scrypt:32768:8:1"),
+            # поэтому сравниваем с префиксом реально сгенерированного хэша
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,105 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class RenditionCache:
+    """Дисковый LRU-кэш рендишенов, создаваемых по запросу (?w=320 и т.п.).
+
+    Суммарный размер файлов ограничен max_bytes: при переполнении удаляются
+    давно не запрошенные рендишены. Порядок LRU держится в памяти и при старте
+    восстанавливается по времени доступа файлов.
+
+    Лимит - на процесс: рабочие процессы с общим root не видят записей друг
+    друга, поэтому каталог может вырасти до max_bytes на каждый процесс.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> размер файла, от старых к свежим
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def rebuild(self):
+        """Собирает LRU из файлов, оставшихся с прошлого запуска"""
+        found = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                found.append((max(stat.st_atime, stat.st_mtime), key, stat.st_size))
+        found.sort()
+
+        with self._lock:
+            self._entries = OrderedDict((key, size) for _, key, size in found)
+            self._total_bytes = sum(size for _, _, size in found)
+            self._evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key: str):
+        """Путь к закэшированному рендишену или None; отмечает его как свежий"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        return self.path(key)
+
+    def get_or_create(self, key: str, render):
+        """Путь к рендишену; при промахе render() -> bytes вызывается один раз на ключ"""
+        path = self.get(key)
+        if path:
+            return path
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            path = self.get(key)
+            if not path:
+                path = self.put(key, render())
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, target)
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict(keep=key)
+        return target
+
+    def discard(self, key: str):
+        """Забывает рендишен, файл которого пропал (например, удален другим процессом)"""
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+
+    def _evict(self, keep: str = None):
+        """Удаляет самые старые рендишены, пока кэш не уложится в лимит (под self._lock)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
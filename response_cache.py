@@ -0,0 +1,162 @@
+import json
+import threading
+
+from ttl_cache import TTLCache
+
+
+class LocalCacheBackend:
+    """Кэш в памяти процесса (TTL + LRU). Каждый процесс держит свою копию"""
+
+    def __init__(self, config):
+        self._entries = TTLCache(config.get('RESPONSE_CACHE_SIZE', 1024), config.get('RESPONSE_CACHE_TTL', 60))
+        # Поколения храним отдельно: вытеснение счетчика вернуло бы старые страницы
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._entries.pop(key)
+
+    def counter(self, name) -> int:
+        return self._counters.get(name, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Общий кэш для нескольких рабочих процессов (нужен пакет redis).
+
+    Ограничение по размеру - maxmemory/allkeys-lru на стороне Redis.
+    """
+
+    def __init__(self, config):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND = 'redis' requires the redis package") from e
+        self._client = redis.Redis.from_url(config['RESPONSE_CACHE_URL'])
+        self._ttl = config.get('RESPONSE_CACHE_TTL', 60)
+        self._prefix = config.get('RESPONSE_CACHE_PREFIX', 'rikoa:')
+
+    def get(self, key):
+        return self._client.get(self._prefix + key)
+
+    def set(self, key, value):
+        self._client.set(self._prefix + key, value, ex=self._ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self._prefix + key for key in keys))
+
+    def counter(self, name) -> int:
+        return int(self._client.get(self._prefix + name) or 0)
+
+    def incr(self, name):
+        self._client.incr(self._prefix + name)
+
+    def size(self) -> int:
+        return self._client.dbsize()
+
+
+CACHE_BACKENDS = {
+    'local': LocalCacheBackend,
+    'redis': RedisCacheBackend,
+}
+
+
+class ResponseCache:
+    """Read-through кэш готовых JSON-ответов каталога.
+
+    Ключи: feed:<поколение>:<параметры>, product:<id>, buyers:<id>. Страницы ленты
+    зависят от порядка всех товаров, поэтому сбрасываются сменой поколения, а
+    карточка и покупатели товара - удалением своих ключей. У страниц ?sort=popular
+    есть еще свое поколение: покупки меняют только их порядок.
+    """
+
+    FEED_GENERATION = 'feed:generation'
+    POPULAR_GENERATION = 'feed:popular:generation'
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def feed_key(self, *params, popular: bool = False) -> str:
+        generation = self.backend.counter(self.FEED_GENERATION)
+        if popular:
+            generation = f"{generation}.{self.backend.counter(self.POPULAR_GENERATION)}"
+        return f"feed:{generation}:" + ':'.join(str(param) for param in params)
+
+    @staticmethod
+    def product_key(product_id: str) -> str:
+        return f"product:{product_id}"
+
+    @staticmethod
+    def buyers_key(product_id: str) -> str:
+        return f"buyers:{product_id}"
+
+    def get(self, key):
+        """(body, headers) или None"""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        entry = json.loads(value)
+        return entry['body'], entry['headers']
+
+    def set(self, key, body: str, headers: dict):
+        self.backend.set(key, json.dumps({'body': body, 'headers': headers}))
+
+    def invalidate_feed(self):
+        self.backend.incr(self.FEED_GENERATION)
+        self._count_invalidation()
+
+    def invalidate_popular_feed(self):
+        """Сброс только страниц ?sort=popular (порядок по buyers_count)"""
+        self.backend.incr(self.POPULAR_GENERATION)
+        self._count_invalidation()
+
+    def invalidate_product(self, product_id: str, buyers: bool = False):
+        keys = [self.product_key(product_id)]
+        if buyers:
+            keys.append(self.buyers_key(product_id))
+        self.backend.delete(*keys)
+        self._count_invalidation()
+
+    def _count_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Счетчики этого процесса (размер - по бэкенду)"""
+        with self._lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hitRatio': round(hits / total, 4) if total else None,
+            'invalidations': invalidations,
+            'size': self.backend.size(),
+        }
+
+
+def create_response_cache(config) -> ResponseCache:
+    """Создает кэш по config['RESPONSE_CACHE_BACKEND'] ('local' или 'redis')"""
+    backend = CACHE_BACKENDS[config.get('RESPONSE_CACHE_BACKEND', 'local')]
+    return ResponseCache(backend(config))
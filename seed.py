@@ -7,83 +7,12 @@ PURCHASE_PERCENTAGE = 0.6        # Процент покупки артов др
 
 import os
 import random
-import uuid
-from PIL import Image
 from web_server import create_app
 from database import db_manager
+from image_pipeline import process_image
+from storage import content_hash
 
 
-# Заменяем функцию process_uploaded_image
-def process_uploaded_image(file, upload_folder):
-    """Обрабатывает загруженное изображение с динамическим разрешением"""
-    try:
-        # Загружаем изображение
-        image = Image.open(file)
-        width, height = image.size
-        
-        # Генерируем уникальное имя файла
-        file_id = str(uuid.uuid4())
-        
-        # 🔥 ДИНАМИЧЕСКОЕ РАЗРЕШЕНИЕ ДЛЯ ПРЕВЬЮ
-        if width > 2000 or height > 2000:
-            thumbnail_size = (800, 800)
-        elif width > 1000 or height > 1000:
-            thumbnail_size = (1200, 1200)
-        else:
-            thumbnail_size = (min(width, 1600), min(height, 1600))
-        
-        original_extension = image.format.lower()
-        thumbnail_filename = f"{file_id}_thumbnail.{original_extension}"
-
-        # Создаем и сохраняем превью
-        image.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-        thumbnail_path = os.path.join(upload_folder, 'thumbnails', thumbnail_filename)
-        
-        # Сохраняем превью
-        if image.format == 'PNG':
-            image.save(thumbnail_path, optimize=True)
-        else:
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            image.save(thumbnail_path, optimize=True, quality=80)
-        
-        image.close()
-        
-        return {
-            'thumbnail': thumbnail_filename,
-            'file_id': file_id
-        }, None
-        
-    except Exception as e:
-        return None, f"Image processing error: {str(e)}"
-    
-class SimpleFile:
-    def __init__(self, path):
-        self.path = path
-        self.filename = os.path.basename(path)
-        self._file = None
-    
-    def seek(self, pos, whence=0):
-        if self._file is None:
-            self._file = open(self.path, 'rb')
-        self._file.seek(pos, whence)
-    
-    def tell(self):
-        if self._file is None:
-            self._file = open(self.path, 'rb')
-        return self._file.tell()
-    
-    def read(self, size=-1):
-        if self._file is None:
-            self._file = open(self.path, 'rb')
-        return self._file.read(size)
-    
-    def close(self):
-        if self._file:
-            self._file.close()
-
 def seed_database_simple():
     """Упрощенная версия заполнения БД"""
     
@@ -112,6 +41,9 @@ def seed_database_simple():
         
         print(f"📁 Найдено {len(image_files)} изображений")
         
+        storage = app.extensions['storage']
+        image_index = app.extensions['image_index']
+        
         # Проверяем, что хватает изображений для создания артов
         if len(image_files) < NUM_PRODUCTS:
             print(f"⚠️  Внимание: запрошено {NUM_PRODUCTS} артов, но найдено только {len(image_files)} изображений")
@@ -159,18 +91,25 @@ def seed_database_simple():
                 adjective = random.choice(adjectives)
                 title = f"{adjective} {filename_without_ext}"
                 
-                # Имитируем загрузку файла
-                file_obj = SimpleFile(image_path)
-                
-                # Получаем настройки из конфига приложения
-                upload_folder = app.config['UPLOAD_FOLDER']
-                # thumbnail_size = app.config['THUMBNAIL_SIZE']
+                # Тот же пайплайн рендишенов, что и у сервера
+                with open(image_path, 'rb') as image_source:
+                    data = image_source.read()
+                file_id = content_hash(data)
                 
-                image_info, error = process_uploaded_image(file_obj, upload_folder)
+                image_info, error = None, None
+                if not image_index.get(file_id):
+                    image_info, error = process_image(
+                        data, file_id, storage,
+                        app.config['MAX_IMAGE_DIMENSION'],
+                        app.config['MAX_IMAGE_PIXELS'],
+                        app.config['REENCODE_ORIGINALS']
+                    )
+                    if not error:
+                        image_index.register(image_info)
                 
                 if not error:
                     product = db_manager.create_product(
-                        photo_url=image_info['file_id'],
+                        photo_url=file_id,
                         creator_id=creator.id,
                         title=title,
                         price=random.randint(100, 2000),
@@ -180,8 +119,6 @@ def seed_database_simple():
                     print(f"   ✅ Создан арт: {product.title} (цена: {product.price})")
                 else:
                     print(f"   ❌ Ошибка обработки изображения: {error}")
-                
-                file_obj.close()
                         
             except Exception as e:
                 print(f"   ❌ Ошибка создания арта: {e}")
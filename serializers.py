@@ -0,0 +1,59 @@
+import json
+
+from models import image_urls
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def public_account(row) -> dict:
+    """Account.to_dict() из кортежа (id, nickname, mail, created_at)"""
+    return {
+        'id': row.id,
+        'nickname': row.nickname,
+        'mail': row.mail,
+        'createdAt': row.created_at.isoformat() if row.created_at else None
+    }
+
+
+def feed_product(row) -> dict:
+    """Product.to_dict() из строки DatabaseManager.get_feed_rows"""
+    urls = image_urls(row.photo_url)
+    creator = None
+    if row.creator_id is not None:
+        creator = {
+            'id': row.creator_id,
+            'nickname': row.creator_nickname,
+            'mail': row.creator_mail,
+            'createdAt': row.creator_created_at.isoformat() if row.creator_created_at else None
+        }
+    return {
+        'id': row.id,
+        'photoUrl': urls['thumbnail'],
+        'photoSrcset': urls['srcset'],
+        'title': row.title,
+        'price': row.price,
+        'description': row.description or '',
+        'updatedAt': row.updated_at.isoformat() if row.updated_at else None,
+        'creator': creator
+    }
+
+
+def dumps(data, indent: bool = False) -> bytes:
+    """JSON-тело ответа как у jsonify: ключи отсортированы, перевод строки в конце.
+
+    indent - отступ в 2 пробела (jsonify так делает в debug-режиме), иначе компактно.
+    С orjson не-ASCII символы пишутся как UTF-8, а не \\uXXXX - JSON тот же.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if indent:
+        text = json.dumps(data, ensure_ascii=True, sort_keys=True, indent=2)
+    else:
+        text = json.dumps(data, ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+    return (text + '\n').encode('utf-8')
@@ -0,0 +1,123 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import Flask, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+logger = logging.getLogger('sql_profiler')
+
+# Списки параметров IN (?, ?, ...) разной длины - одна и та же форма запроса
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """Нормализованный текст запроса: параметры уже заменены на ?, убираем пробелы и длину IN-списков"""
+    return _IN_LIST.sub('(?...)', _SPACES.sub(' ', statement).strip())
+
+
+class RequestProfile:
+    __slots__ = ('count', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+
+class SQLProfiler:
+    """Профилирование SQL по запросам на событиях движка SQLAlchemy (включается SQL_PROFILER).
+
+    Для каждого запроса считает число выражений, суммарное время в базе и
+    повторы одинаковых по форме выражений. Медленные выражения и вероятные
+    N+1 (одна форма чаще SQL_N_PLUS_ONE_THRESHOLD раз) пишутся в лог с роутом;
+    итог запроса - JSON-строкой в лог sql_profiler и, если включено
+    SQL_PROFILER_HEADERS, в заголовки X-SQL-*.
+    """
+
+    def __init__(self, app: Flask = None):
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.slow_query_seconds = app.config.get('SQL_SLOW_QUERY_MS', 100) / 1000
+        self.n_plus_one_threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['sql_profiler'] = self
+
+    def _start_request(self):
+        g._sql_profile = RequestProfile()
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            connection.info.setdefault('sql_profiler_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        started = connection.info.get('sql_profiler_started')
+        if not started or not has_request_context():
+            return
+        elapsed = time.perf_counter() - started.pop()
+
+        profile = g.get('_sql_profile')
+        if profile is None:
+            return
+        profile.count += 1
+        profile.seconds += elapsed
+        profile.shapes[statement_shape(statement)] += 1
+
+        if elapsed >= self.slow_query_seconds:
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'route': request.endpoint,
+                'method': request.method,
+                'path': request.path,
+                'ms': round(elapsed * 1000, 2),
+                'statement': statement_shape(statement),
+            }, ensure_ascii=False))
+
+    def _finish_request(self, response):
+        profile = g.pop('_sql_profile', None)
+        if profile is None:
+            return response
+
+        repeated = [
+            {'statement': shape, 'count': count}
+            for shape, count in profile.shapes.most_common()
+            if count > self.n_plus_one_threshold
+        ]
+        for item in repeated:
+            logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'route': request.endpoint,
+                'path': request.path,
+                **item,
+            }, ensure_ascii=False))
+
+        logger.info(json.dumps({
+            'event': 'request_sql',
+            'route': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'statements': profile.count,
+            'db_ms': round(profile.seconds * 1000, 2),
+            'repeated': len(repeated),
+        }, ensure_ascii=False))
+
+        # По умолчанию - по debug текущего приложения: main.py включает его в app.run(), уже после init_app
+        if current_app.config.get('SQL_PROFILER_HEADERS', current_app.debug):
+            response.headers['X-SQL-Count'] = str(profile.count)
+            response.headers['X-SQL-Time-ms'] = f"{profile.seconds * 1000:.2f}"
+            response.headers['X-SQL-Repeated'] = str(len(repeated))
+        return response
@@ -0,0 +1,129 @@
+import abc
+import hashlib
+import os
+import uuid
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 содержимого - он же file_id для новых загрузок"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class StorageBackend(abc.ABC):
+    """Интерфейс хранилища файлов изображений. Ключ - относительный путь объекта.
+
+    root - локальный каталог бэкенда (UPLOAD_FOLDER): в нем ImageIndex ведет
+    манифест и ищет файлы старых загрузок, даже если сами объекты хранятся не локально.
+    Бэкенд без object_key/exists/save/open не создастся (TypeError при создании).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @abc.abstractmethod
+    def object_key(self, digest: str, extension: str, rendition: str = None) -> str:
+        """Ключ объекта по SHA-256 содержимого, расширению и рендишену"""
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        """Есть ли объект с таким ключом"""
+
+    @abc.abstractmethod
+    def save(self, key: str, data: bytes):
+        """Записывает объект целиком"""
+
+    @abc.abstractmethod
+    def open(self, key: str):
+        """Бинарный файловый объект для чтения"""
+
+    def path(self, key: str) -> str:
+        """Локальный путь для send_file; None, если бэкенд не локальный"""
+        return None
+
+    def adopt(self, source_path: str, key: str):
+        """Переносит существующий файл в хранилище под ключом key"""
+        with open(source_path, 'rb') as source:
+            self.save(key, source.read())
+        os.remove(source_path)
+
+
+class ShardedFileStorage(StorageBackend):
+    """Локальное хранилище с раскладкой ab/cd/<sha256> вместо одной плоской папки"""
+
+    def object_key(self, digest: str, extension: str, rendition: str = None) -> str:
+        name = f"{digest}_{rendition}.{extension}" if rendition else f"{digest}.{extension}"
+        return '/'.join((digest[:2], digest[2:4], name))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def save(self, key: str, data: bytes):
+        """Атомарная запись: параллельная загрузка того же файла не увидит его недописанным"""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, target)
+
+    def open(self, key: str):
+        return open(self.path(key), 'rb')
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def adopt(self, source_path: str, key: str):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source_path, target)
+
+
+STORAGE_BACKENDS = {
+    'sharded': ShardedFileStorage,
+}
+
+
+def create_storage(config) -> StorageBackend:
+    """Создает бэкенд по config['STORAGE_BACKEND'] с корнем в UPLOAD_FOLDER"""
+    backend = STORAGE_BACKENDS[config.get('STORAGE_BACKEND', 'sharded')]
+    return backend(config['UPLOAD_FOLDER'])
+
+
+def migrate_legacy_uploads(storage: StorageBackend, image_index) -> int:
+    """Переносит файлы со старыми UUID file_id в раскладку по хэшу содержимого.
+
+    Старый file_id остается в манифесте как псевдоним нового ключа, поэтому
+    photo_url существующих товаров продолжает работать без изменений в базе.
+    """
+    migrated = 0
+    for file_id, entry in list(image_index.entries()):
+        if entry.get('content_hash'):
+            continue
+        source_key = entry.get('original') or entry.get('thumbnail')
+        if not source_key or not storage.exists(source_key):
+            continue
+        with storage.open(source_key) as source:
+            digest = content_hash(source.read())
+
+        fields = {'format': entry.get('format'), 'content_hash': digest}
+        for rendition in ('original', 'thumbnail'):
+            old_key = entry.get(rendition)
+            if not old_key or not storage.exists(old_key):
+                continue
+            extension = old_key.rsplit('.', 1)[-1]
+            new_key = storage.object_key(digest, extension, None if rendition == 'original' else rendition)
+            storage.adopt(storage.path(old_key), new_key)
+            fields[rendition] = new_key
+
+        image_index.add(digest, **fields)
+        image_index.add(file_id, **fields)
+        migrated += 1
+    return migrated
+
+
+if __name__ == '__main__':
+    from web_server import create_app
+
+    app = create_app()
+    count = migrate_legacy_uploads(app.extensions['storage'], app.extensions['image_index'])
+    print(f"Перенесено загрузок: {count}")
@@ -0,0 +1,48 @@
+"""Общие фикстуры: приложение на свежей SQLite-базе во временном каталоге"""
+import itertools
+
+import pytest
+
+import migrations
+from models import db
+from web_server import create_app
+
+_counter = itertools.count()
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('app')
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{data_dir / 'app.db'}",
+        'UPLOAD_FOLDER': str(data_dir / 'uploads'),
+        'RENDITION_CACHE_FOLDER': str(data_dir / 'uploads' / 'cache'),
+        'IMAGE_WORKERS': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1',
+    }
+    # Схему создает миграция, а приложение со сверкой версии поднимается уже на готовой базе
+    with create_app({**config, 'DB_SCHEMA_CHECK': False}).app_context():
+        migrations.upgrade(db.engine.url, log=lambda *args: None)
+        db.engine.dispose()
+
+    app = create_app(config)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    """register() -> ответ регистрации нового аккаунта (id, token, ...)"""
+    def register():
+        n = next(_counter)
+        response = client.post('/api/auth/register', json={
+            'login': f'user{n}', 'mail': f'user{n}@example.com', 'password': 'secret-password'})
+        assert response.status_code == 201
+        return response.get_json()
+    return register
@@ -0,0 +1,61 @@
+"""Шарды MetricsRegistry: потоки приходят и уходят, а шардов не становится больше"""
+import threading
+
+from metrics import MetricsRegistry
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_finished_threads_fold_into_totals():
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', "Jobs")
+    registry.gauge('jobs_in_flight', "Jobs in flight")
+    registry.histogram('job_seconds', "Job latency", buckets=(0.1, 1.0))
+
+    def job():
+        registry.inc('jobs_total', kind='test')
+        registry.gauge_add('jobs_in_flight', 1)
+        registry.observe('job_seconds', 0.5)
+        registry.gauge_add('jobs_in_flight', -1)
+
+    for _ in range(20):
+        run_threads(job, 10)
+        registry.snapshot()
+        assert len(registry._shards) <= 1
+
+    registry.inc('jobs_total', kind='test')
+    snapshot = registry.snapshot()
+    assert snapshot['counters'][('jobs_total', (('kind', 'test'),))] == 201
+    assert snapshot['gauges'][('jobs_in_flight', ())] == 0
+    assert snapshot['histograms'][('job_seconds', ())] == [0, 200, 0, 100.0]
+    assert registry._shards == {registry._shard()}
+
+
+def test_live_threads_keep_their_shards():
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', "Jobs")
+    started, release = threading.Barrier(6), threading.Event()
+
+    def job():
+        registry.inc('jobs_total')
+        started.wait()
+        release.wait()
+        registry.inc('jobs_total')
+
+    threads = [threading.Thread(target=job) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    assert len(registry._shards) == 5
+    assert registry.snapshot()['counters'][('jobs_total', ())] == 5
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert registry.snapshot()['counters'][('jobs_total', ())] == 10
+    assert not registry._shards
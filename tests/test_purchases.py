@@ -0,0 +1,126 @@
+"""Покупка через /api/product/buy: одиночная ({"id"}) и корзина ({"ids"})"""
+import itertools
+
+import pytest
+
+from database import db_manager
+from models import Product, db
+
+
+@pytest.fixture
+def buyer(register):
+    return {'Authorization': f"Bearer {register()['token']}"}
+
+
+@pytest.fixture
+def make_product(app, register):
+    creator = register()
+    products = itertools.count()
+
+    def make(status=Product.STATUS_READY):
+        n = next(products)
+        with app.app_context():
+            return db_manager.create_product(f'file{n}', creator['id'], f'Work {n}', 100, '', status=status).id
+    return make
+
+
+def buy(client, headers, **body):
+    return client.post('/api/product/buy', json=body, headers=headers)
+
+
+def buyers_count(app, product_id):
+    with app.app_context():
+        return db.session.get(Product, product_id).buyers_count
+
+
+@pytest.mark.parametrize('spelling', [str.upper, lambda product_id: product_id.replace('-', '')],
+                         ids=['upper', 'no-hyphens'])
+def test_buy_with_non_canonical_id(app, client, buyer, make_product, spelling):
+    product_id = make_product()
+    alias = spelling(product_id)
+
+    response = buy(client, buyer, id=alias)
+    assert response.status_code == 201
+    assert response.get_json()['purchase']['product_id'] == product_id
+
+    response = buy(client, buyer, ids=[alias, product_id, 'not-a-uuid'])
+    assert response.status_code == 200
+    assert [(item['id'], item['status']) for item in response.get_json()['results']] == [
+        (alias, db_manager.PURCHASE_EXISTS), (product_id, db_manager.PURCHASE_EXISTS),
+        ('not-a-uuid', db_manager.PURCHASE_NOT_FOUND)]
+    assert buyers_count(app, product_id) == 1
+
+
+def test_buy_single_product(app, client, buyer, make_product):
+    product_id = make_product()
+
+    response = buy(client, buyer, id=product_id)
+    assert response.status_code == 201
+    purchase = response.get_json()['purchase']
+    assert purchase['product_id'] == product_id
+
+    # Повторная покупка идемпотентна: та же покупка, счетчик не растет
+    response = buy(client, buyer, id=product_id)
+    assert response.status_code == 201
+    assert response.get_json()['purchase']['id'] == purchase['id']
+    assert buyers_count(app, product_id) == 1
+
+
+@pytest.mark.parametrize('status', [Product.STATUS_PROCESSING, Product.STATUS_FAILED])
+def test_unready_product_cannot_be_bought(app, client, buyer, make_product, status):
+    product_id = make_product(status)
+    assert buy(client, buyer, id=product_id).status_code == 404
+
+    response = buy(client, buyer, ids=[product_id])
+    assert response.get_json()['results'] == [{'id': product_id, 'status': db_manager.PURCHASE_NOT_FOUND}]
+    assert buyers_count(app, product_id) == 0
+
+
+def test_buy_unknown_product(client, buyer):
+    assert buy(client, buyer, id='00000000-0000-0000-0000-000000000000').status_code == 404
+    assert buy(client, buyer, id='not-a-uuid').status_code == 404
+
+
+def test_checkout_reports_status_per_item(app, client, buyer, make_product):
+    owned, fresh, unready = make_product(), make_product(), make_product(Product.STATUS_PROCESSING)
+    missing = '00000000-0000-0000-0000-000000000000'
+    assert buy(client, buyer, id=owned).status_code == 201
+
+    response = buy(client, buyer, ids=[owned, fresh, missing, unready])
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [(item['id'], item['status']) for item in results] == [
+        (owned, db_manager.PURCHASE_EXISTS), (fresh, db_manager.PURCHASE_CREATED),
+        (missing, db_manager.PURCHASE_NOT_FOUND), (unready, db_manager.PURCHASE_NOT_FOUND)]
+    assert [item['purchase']['product_id'] for item in results if 'purchase' in item] == [owned, fresh]
+    assert [buyers_count(app, product_id) for product_id in (owned, fresh, unready)] == [1, 1, 0]
+
+
+def test_checkout_duplicate_ids(app, client, buyer, make_product):
+    product_id = make_product()
+
+    response = buy(client, buyer, ids=[product_id, product_id, product_id])
+    assert response.status_code == 200
+    assert [(item['id'], item['status']) for item in response.get_json()['results']] == [
+        (product_id, db_manager.PURCHASE_CREATED)]
+    assert buyers_count(app, product_id) == 1
+
+
+def test_checkout_item_limit(app, client, buyer, make_product):
+    limit = app.config['CHECKOUT_MAX_ITEMS']
+    product_id = make_product()
+
+    response = buy(client, buyer, ids=[product_id] * (limit + 1))
+    assert response.status_code == 400
+    assert buyers_count(app, product_id) == 0
+    assert buy(client, buyer, ids=[product_id] * limit).status_code == 200
+
+
+@pytest.mark.parametrize('body', [{}, {'ids': []}, {'ids': 'abc'}, {'ids': [1]}, {'id': 1}],
+                         ids=['empty', 'no-ids', 'ids-string', 'ids-numbers', 'id-number'])
+def test_buy_rejects_malformed_body(client, buyer, body):
+    assert buy(client, buyer, **body).status_code == 400
+
+
+def test_buy_requires_token(client, make_product):
+    assert buy(client, {}, id=make_product()).status_code == 401
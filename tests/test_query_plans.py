@@ -0,0 +1,88 @@
+"""Планы запросов каталога на большом сгенерированном наборе данных (SQLite).
+
+Ни один запрос ленты (все комбинации sort / creator / цены, первая и курсорная
+страницы), поиска, профиля и покупателей не должен читать таблицу целиком
+(SCAN <таблица>) или сортировать выборку во временном B-дереве (USE TEMP B-TREE).
+Размер набора - QUERY_PLAN_PRODUCTS товаров (по умолчанию 50000).
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from check_query_plans import (CATALOG_CASES, SEARCH_CASES, SEARCH_QUERIES, catalog_statement, explain,
+                               other_statements, problems, sample_params, search_statement)
+from models import db
+from web_server import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTS = int(os.environ.get('QUERY_PLAN_PRODUCTS', 50000))
+OTHER_STATEMENTS = ('profile posted', 'profile bayed', 'buyers')
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('query_plans')
+    database_path = data_dir / 'plans.db'
+    uploads = data_dir / 'uploads'
+    subprocess.run([
+        sys.executable, os.path.join(ROOT, 'generate_dataset.py'),
+        '--accounts', str(max(PRODUCTS // 10, 10)), '--products', str(PRODUCTS),
+        '--purchases', str(PRODUCTS * 3), '--images', '3', '--prefix', 'plans',
+        '--database', f"sqlite:///{database_path}", '--uploads', str(uploads),
+    ], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}",
+        'UPLOAD_FOLDER': str(uploads),
+        'RENDITION_CACHE_FOLDER': str(uploads / 'cache'),
+        'IMAGE_WORKERS': 0,
+    })
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture(scope='module')
+def params(app):
+    with app.app_context():
+        return sample_params()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+def catalog_case_id(case):
+    sort, with_creator, (min_price, max_price), paged = case
+    return f"{sort}-{'creator' if with_creator else 'all'}-{min_price}..{max_price}-{'after' if paged else 'page'}"
+
+
+def search_case_id(case):
+    # Запросы на кириллице pytest экранирует в id - берем номер запроса
+    query, paged = case
+    return f"query{SEARCH_QUERIES.index(query)}-{'after' if paged else 'page'}"
+
+
+def assert_indexed(name, statement):
+    plan = explain(statement)
+    found = problems(plan)
+    assert not found, f"{name}: {'; '.join(found)}\nplan: {' | '.join(plan)}"
+
+
+@pytest.mark.parametrize('case', CATALOG_CASES, ids=catalog_case_id)
+def test_catalog_plan(app_context, params, case):
+    assert_indexed(*catalog_statement(params, *case))
+
+
+@pytest.mark.parametrize('case', SEARCH_CASES, ids=search_case_id)
+def test_search_plan(app_context, params, case):
+    assert_indexed(*search_statement(params, *case))
+
+
+@pytest.mark.parametrize('name', OTHER_STATEMENTS)
+def test_profile_and_buyers_plan(app_context, params, name):
+    assert_indexed(name, dict(other_statements(params))[name])
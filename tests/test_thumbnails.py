@@ -0,0 +1,40 @@
+"""Выбор формата превью по заголовку Accept"""
+import io
+
+import pytest
+from PIL import Image
+
+from image_pipeline import VARIANT_FORMATS
+from storage import content_hash
+
+
+@pytest.fixture(scope='module')
+def file_id(app):
+    client = app.test_client()
+    creator = client.post('/api/auth/register', json={
+        'login': 'painter', 'mail': 'painter@example.com', 'password': 'secret-password'}).get_json()
+    image = io.BytesIO()
+    Image.new('RGB', (640, 480), (200, 80, 40)).save(image, 'JPEG')
+    response = client.post('/api/products', data={
+        'image': (io.BytesIO(image.getvalue()), 'work.jpg'), 'title': 'Work', 'price': '100',
+        'creator_id': creator['id']})
+    assert response.status_code in (201, 202)
+    # file_id загрузки - SHA-256 содержимого
+    return content_hash(image.getvalue())
+
+
+@pytest.mark.skipif(VARIANT_FORMATS != ['avif', 'webp'], reason='Pillow без AVIF или WebP')
+@pytest.mark.parametrize('accept, mimetype', [
+    ('image/avif, image/webp, */*', 'image/avif'),
+    ('image/avif;q=0, image/webp', 'image/webp'),
+    ('image/avif;q=0.5, image/webp;q=0.9', 'image/webp'),
+    ('image/webp, image/avif', 'image/avif'),
+    ('image/*, image/avif;q=0, image/webp;q=0', 'image/jpeg'),
+    ('image/*, */*', 'image/jpeg'),
+    ('', 'image/jpeg'),
+])
+def test_thumbnail_format_follows_accept(client, file_id, accept, mimetype):
+    response = client.get(f'/api/images/thumbnail/{file_id}', headers={'Accept': accept})
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert 'Accept' in response.vary
@@ -0,0 +1,75 @@
+"""Подписанные токены (tokens.py) и их проверка декоратором token_required"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tokens import _b64decode, _b64encode, issue_token, verify_token
+
+SECRET = 'test-secret'
+ACCOUNT_ID = '0190a8d2-7c4e-7a00-8000-000000000001'
+OTHER_ACCOUNT_ID = '0190a8d2-7c4e-7a00-8000-000000000002'
+
+
+def tamper_signature(token):
+    payload, signature = token.split('.')
+    raw = bytearray(_b64decode(signature))
+    raw[0] ^= 1
+    return f"{payload}.{_b64encode(bytes(raw))}"
+
+
+def test_valid_token():
+    assert verify_token(issue_token(ACCOUNT_ID, SECRET, 60), SECRET) == ACCOUNT_ID
+
+
+def test_expired_token():
+    assert verify_token(issue_token(ACCOUNT_ID, SECRET, -1), SECRET) is None
+
+
+def test_tampered_token():
+    token = issue_token(ACCOUNT_ID, SECRET, 60)
+    assert verify_token(tamper_signature(token), SECRET) is None
+    # Чужой account_id с прежней подписью
+    payload, signature = token.split('.')
+    forged = _b64decode(payload).decode('utf-8').replace(ACCOUNT_ID, OTHER_ACCOUNT_ID)
+    assert verify_token(f"{_b64encode(forged.encode('utf-8'))}.{signature}", SECRET) is None
+    assert verify_token(token, 'other-secret') is None
+
+
+@pytest.mark.parametrize('token', ['', 'abc', 'a.b.c', '!!!.???', ACCOUNT_ID])
+def test_malformed_token(token):
+    assert verify_token(token, SECRET) is None
+
+
+def profile(client, token):
+    return client.get('/api/auth/profile', headers={'Authorization': f'Bearer {token}'})
+
+
+@pytest.fixture
+def account(register):
+    return register()
+
+
+def test_profile_accepts_issued_token(client, account):
+    response = profile(client, account['token'])
+    assert response.status_code == 200
+    assert response.get_json()['id'] == account['id']
+
+
+def test_profile_rejects_expired_and_tampered_tokens(app, client, account):
+    expired = issue_token(account['id'], app.config['SECRET_KEY'], -1)
+    assert profile(client, expired).status_code == 401
+    assert profile(client, tamper_signature(account['token'])).status_code == 401
+    assert client.get('/api/auth/profile').status_code == 401
+
+
+def test_legacy_token_until_cutoff(app, client, account, monkeypatch):
+    # Старый токен - голый ID аккаунта - принимается только до LEGACY_TOKENS_UNTIL
+    monkeypatch.setitem(app.config, 'LEGACY_TOKENS_UNTIL', datetime.now(timezone.utc) + timedelta(days=1))
+    response = profile(client, account['id'])
+    assert response.status_code == 200
+    assert response.get_json()['id'] == account['id']
+    assert profile(client, '00000000-0000-0000-0000-000000000000').status_code == 401
+
+    monkeypatch.setitem(app.config, 'LEGACY_TOKENS_UNTIL', datetime.now(timezone.utc) - timedelta(seconds=1))
+    assert profile(client, account['id']).status_code == 401
+    assert profile(client, account['token']).status_code == 200
@@ -0,0 +1,40 @@
+import base64
+import hashlib
+import hmac
+import time
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def _sign(payload: str, secret: str) -> bytes:
+    return hmac.new(secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).digest()
+
+
+def issue_token(account_id: str, secret: str, ttl: int) -> str:
+    """Подписанный токен "<account_id>.<expires_at>" - проверяется без обращения к базе"""
+    payload = f"{account_id}.{int(time.time()) + ttl}"
+    return f"{_b64encode(payload.encode('utf-8'))}.{_b64encode(_sign(payload, secret))}"
+
+
+def verify_token(token: str, secret: str):
+    """ID аккаунта из токена или None, если подпись неверна или срок истек"""
+    try:
+        encoded_payload, encoded_signature = token.split('.')
+        payload = _b64decode(encoded_payload).decode('utf-8')
+        signature = _b64decode(encoded_signature)
+        account_id, expires_at = payload.rsplit('.', 1)
+        expires_at = int(expires_at)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+    if not hmac.compare_digest(signature, _sign(payload, secret)):
+        return None
+    if expires_at < time.time():
+        return None
+    return account_id
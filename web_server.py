@@ -1,27 +1,90 @@
 from flask import Flask, request, jsonify, send_file
-from database import db_manager
+from database import FEED_SORTS, db_manager, engine_options
+from pagination import encode_cursor, decode_cursor
+from image_index import ImageIndex
+from storage import content_hash, create_storage
+from image_pipeline import MIMETYPES, VARIANT_FORMATS, inspect_image, process_image, render_width, transcode
+from jobs import ImageJobQueue, QueueFull
+from models import Product, THUMBNAIL_WIDTHS
+from rendition_cache import RenditionCache
+from response_cache import create_response_cache
+import serializers
+from sql_profiler import SQLProfiler
+from metrics import Metrics
+from models import db
+from tokens import issue_token, verify_token
+from passwords import HasherBusy
 import os
 import datetime
 from datetime import timezone
-from datetime import datetime
-import uuid
-from PIL import Image
+from datetime import datetime, timedelta
 from functools import wraps
-import threading
-import time
 
-def create_app():
+# URL по file_id неизменяемы: содержимое файла никогда не меняется
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def create_app(config: dict = None):
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///art_market.db'
+    # База: DATABASE_URL из окружения (например, postgresql://...), по умолчанию SQLite в instance/
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///art_market.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SECRET_KEY'] = 'your-secret-key-here' #TODO
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))  # Постоянных соединений на процесс
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))  # Временных сверх пула
+    app.config['DB_POOL_TIMEOUT'] = 30  # Секунд ожидания свободного соединения
+    app.config['DB_POOL_RECYCLE'] = 1800  # Переоткрывать соединения старше 30 минут
+    # Сверять версию схемы при старте (схему меняет python -m migrations upgrade)
+    app.config['DB_SCHEMA_CHECK'] = os.environ.get('DB_SCHEMA_CHECK', '1') != '0'
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here') #TODO
+    app.config['TOKEN_TTL'] = 7 * 24 * 3600  # Срок жизни подписанного токена
+    # До этой даты еще принимаются старые токены (голый ID аккаунта)
+    app.config['LEGACY_TOKENS_UNTIL'] = datetime(2027, 1, 1, tzinfo=timezone.utc)
+    app.config['ACCOUNT_CACHE_SIZE'] = 1024  # Аккаунтов в in-process кэше
+    app.config['ACCOUNT_CACHE_TTL'] = 300  # Секунд жизни записи кэша аккаунтов
+    # Хэширование паролей: алгоритм и стоимость (werkzeug), старые хэши пересчитываются при входе
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = 2  # Потоков хэширования - отдельно от потоков запросов
+    app.config['PASSWORD_HASH_QUEUE_SIZE'] = 16  # Сколько хэширований может ждать свободный поток
+    app.config['PASSWORD_HASH_WAIT'] = 5  # Секунд ожидания места в очереди, потом 503
     
     # Настройки для загрузки изображений
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['STORAGE_BACKEND'] = 'sharded'  # Раскладка ab/cd/<sha256>, см. storage.py
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     app.config['MAX_PROCESSING_TIME'] = 30  # 🔥 Максимальное время обработки в секундах
+    app.config['IMAGE_WORKERS'] = 2  # Процессов обработки изображений (0 - обрабатывать прямо в запросе)
+    app.config['IMAGE_QUEUE_SIZE'] = 32  # Сколько загрузок может ждать обработки
+    # Секунд, после которых товар в processing считается брошенным (больше ожидания в очереди + MAX_PROCESSING_TIME)
+    app.config['PROCESSING_STALE_AFTER'] = 600
     app.config['MAX_IMAGE_DIMENSION'] = 10000  # 🔥 Максимальный размер изображения по любой стороне
+    app.config['MAX_IMAGE_PIXELS'] = 50_000_000  # Защита от "бомб": проверяется по заголовку до декодирования
+    app.config['REENCODE_ORIGINALS'] = False  # Оригинал сохраняется как есть, без перекодирования
+    app.config['PRODUCT_PHOTO_MAX_AGE'] = 3600  # Кэш /photos/<product_id> (URL по ID товара, а не файла)
+    app.config['THUMBNAIL_WIDTHS'] = THUMBNAIL_WIDTHS  # Допустимые ?w= для превью
+    app.config['RENDITION_CACHE_FOLDER'] = os.path.join('uploads', 'cache')
+    app.config['RENDITION_CACHE_MAX_BYTES'] = 1024 * 1024 * 1024  # 1GB рендишенов по запросу
+    app.config['BUYERS_LIMIT'] = 6  # Сколько последних покупателей отдаем в списках
+    app.config['PROFILE_PRODUCTS_LIMIT'] = 20  # Размер страницы bayed/posted в профиле
+    app.config['CHECKOUT_MAX_ITEMS'] = 50  # Максимум товаров в одной покупке (ids)
+    app.config['SEARCH_QUERY_MAX_LENGTH'] = 200  # Символов в ?q= поиска
+    # Кэш JSON-ответов каталога: 'local' - в памяти процесса, 'redis' - общий для процессов
+    app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'local')
+    app.config['RESPONSE_CACHE_URL'] = os.environ.get('RESPONSE_CACHE_URL', 'redis://localhost:6379/0')
+    app.config['RESPONSE_CACHE_SIZE'] = 1024  # Ответов в локальном кэше
+    app.config['RESPONSE_CACHE_TTL'] = 60  # Секунд - страховка на случай записи мимо DatabaseManager
+    # Профилирование SQL по запросам (X-SQL-* заголовки в debug, JSON-логи sql_profiler)
+    app.config['SQL_PROFILER'] = os.environ.get('SQL_PROFILER', '0') == '1'
+    app.config['SQL_SLOW_QUERY_MS'] = 100  # Медленные выражения - в лог с роутом
+    app.config['SQL_N_PLUS_ONE_THRESHOLD'] = 5  # Одна форма выражения чаще - вероятный N+1
+    # Метрики /api/metrics; при нескольких рабочих процессах укажите общий METRICS_DIR
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+    app.config['METRICS_FLUSH_INTERVAL'] = 5  # Секунд между сбросами снимка процесса в METRICS_DIR
+    
+    # Переопределения (тесты, бенчмарки, отдельные окружения)
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
     
     # Создаем папку для загрузок
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -29,6 +92,47 @@ def create_app():
     
     # Initialize database
     db_manager.init_app(app)
+    if app.config['SQL_PROFILER']:
+        SQLProfiler(app)
+    
+    with app.app_context():
+        metrics = Metrics(app, engine=db.engine,
+                          image_endpoints=('serve_image', 'serve_original_image', 'serve_thumbnail_image'))
+    
+    # Хранилище и индекс загруженных изображений: индекс собирается один раз при старте
+    storage = create_storage(app.config)
+    image_index = ImageIndex(storage)
+    image_index.rebuild()
+    app.extensions['storage'] = storage
+    app.extensions['image_index'] = image_index
+    
+    # Рендишены нужной ширины создаются лениво и живут в ограниченном дисковом LRU
+    rendition_cache = RenditionCache(app.config['RENDITION_CACHE_FOLDER'], app.config['RENDITION_CACHE_MAX_BYTES'])
+    rendition_cache.rebuild()
+    app.extensions['rendition_cache'] = rendition_cache
+    
+    # Пул процессов обработки загрузок (рабочие процессы стартуют при первой загрузке)
+    image_jobs = None
+    if app.config['IMAGE_WORKERS'] > 0:
+        image_jobs = ImageJobQueue(
+            max_workers=app.config['IMAGE_WORKERS'],
+            max_pending=app.config['IMAGE_QUEUE_SIZE'],
+            timeout=app.config['MAX_PROCESSING_TIME']
+        )
+    app.extensions['image_jobs'] = image_jobs
+    
+    # Кэш ответов каталога; DatabaseManager сбрасывает затронутые ключи при записи
+    response_cache = create_response_cache(app.config)
+    app.extensions['response_cache'] = response_cache
+    
+    # Загрузки, чью обработку прервал перезапуск или падение процесса, иначе остались бы в processing навсегда
+    # (только после проверки версии схемы: CLI миграций создает приложение и для пустой базы)
+    if app.config['DB_SCHEMA_CHECK']:
+        with app.app_context():
+            stale_before = datetime.utcnow() - timedelta(seconds=app.config['PROCESSING_STALE_AFTER'])
+            failed = db_manager.fail_stale_products(stale_before, 'Image processing was interrupted by a server restart')
+            if failed:
+                app.logger.warning("Marked %d interrupted uploads as failed", failed)
     
     def allowed_file(filename):
         """Проверка расширения файла"""
@@ -36,113 +140,191 @@ def create_app():
                filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
     
 
-    def process_uploaded_image_with_timeout(file, timeout=30):
-        """Обрабатывает загруженное изображение с таймаутом"""
-        result = [None]
-        error = [None]
+    def read_uploaded_image(file):
+        """Читает загрузку из form-data с проверкой размера файла"""
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)
         
-        def process():
-            try:
-                result[0], error[0] = process_uploaded_image(file)
-            except Exception as e:
-                error[0] = f"Processing error: {str(e)}"
+        if file_size > 15 * 1024 * 1024:
+            return None, "File too large (max 15MB)"
+        
+        return file.read(), None
+    
+    def finish_image_job(product_id):
+        """Колбэк фоновой обработки: регистрирует файлы и переводит товар в ready/failed"""
+        def callback(result, error):
+            image_info, error = result if result else (None, error)
+            metrics.record_upload(image_info, error)
+            with app.app_context():
+                if error:
+                    db_manager.set_product_status(product_id, Product.STATUS_FAILED, error)
+                    return
+                image_index.register(image_info)
+                db_manager.set_product_status(product_id, Product.STATUS_READY)
+        return callback
+    
+    def cached_image_response(etag, get_path, mimetype=None, max_age=IMMUTABLE_MAX_AGE, immutable=True):
+        """Ответ с сильным ETag и Cache-Control.
+
+        Совпавший If-None-Match отвечается 304 без открытия файла (get_path не вызывается);
+        остальное (Range, If-Modified-Since) обрабатывает send_file(conditional=True).
+        """
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            response = send_file(get_path(), mimetype=mimetype, etag=etag, conditional=True)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+        return response
+    
+    def send_image(file_id, rendition, max_age=IMMUTABLE_MAX_AGE, immutable=True):
+        """Отдает сохраненный файл изображения (original / thumbnail / thumbnail_webp ...)"""
+        file_path = image_index.path(file_id, rendition)
+        if not file_path:
+            return None
         
-        thread = threading.Thread(target=process)
-        thread.start()
-        thread.join(timeout)
+        etag = image_index.etag(file_id, rendition)
+        mimetype = MIMETYPES.get(file_path.rsplit('.', 1)[-1])
+        return cached_image_response(etag, lambda: file_path, mimetype=mimetype, max_age=max_age, immutable=immutable)
+    
+    def send_cached_rendition(name, extension, etag, render):
+        """Отдает рендишен из дискового кэша, создавая его при первом запросе"""
+        key = f"{name[:2]}/{name[2:4]}/{name}.{extension}"
         
-        if thread.is_alive():
-            return None, "Image processing timeout - file too large or complex"
+        def get_path():
+            path = rendition_cache.get_or_create(key, render)
+            if not os.path.exists(path):
+                # Файл вытеснен другим процессом - создаем заново
+                rendition_cache.discard(key)
+                path = rendition_cache.get_or_create(key, render)
+            return path
         
-        return result[0], error[0]
+        # Рендеринг детерминирован, поэтому ETag известен до создания файла
+        return cached_image_response(etag, get_path, mimetype=MIMETYPES.get(extension))
+    
+    def read_stored(key):
+        with storage.open(key) as stored_file:
+            return stored_file.read()
+    
+    def negotiate_variant(base_extension):
+        """Кодировка превью из явно перечисленных в Accept: с наибольшим q, при равных - AVIF > WebP.
 
-    def process_uploaded_image(file):
-        """Обрабатывает загруженное изображение из form-data с динамическим разрешением"""
-        try:
-            start_time = time.time()
-            
-            # Проверяем размер файла
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-            
-            if file_size > 15 * 1024 * 1024:
-                return None, "File too large (max 15MB)"
-            
-            # Загружаем изображение
-            image = Image.open(file)
-            
-            # Проверяем размеры изображения
-            width, height = image.size
-            max_dimension = app.config['MAX_IMAGE_DIMENSION']
-            
-            if width > max_dimension or height > max_dimension:
-                return None, f"Image dimensions too large (max {max_dimension}x{max_dimension})"
-            
-            # Проверяем формат
-            if image.format not in ['JPEG', 'PNG', 'GIF', 'WEBP']:
-                return None, "Unsupported image format"
-            
-            # Генерируем уникальное имя файла
-            file_id = str(uuid.uuid4())
-            
-            # Сохраняем оригинал с правильным расширением
-            original_extension = image.format.lower()
-            original_filename = f"{file_id}_original.{original_extension}"
-            
-            # 🔥 ДИНАМИЧЕСКОЕ РАЗРЕШЕНИЕ ДЛЯ ПРЕВЬЮ
-            # Определяем оптимальный размер превью на основе оригинала
-            if width > 2000 or height > 2000:
-                thumbnail_size = (800, 800)
-            elif width > 1000 or height > 1000:
-                thumbnail_size = (1200, 1200)
-            else:
-                thumbnail_size = (min(width, 1600), min(height, 1600))
-            
-            # Сохраняем оригинальное расширение для превью
-            thumbnail_filename = f"{file_id}_thumbnail.{original_extension}"
+        Форматы, которые приходят только через image/* или */*, не выбираются (так браузеры
+        без AVIF его не получат); q=0 - явный отказ. None - отдавать исходный формат.
+        """
+        accept = request.accept_mimetypes
+        listed = {mimetype for mimetype, _ in accept}
+        best, best_quality = None, 0
+        for variant in VARIANT_FORMATS:
+            mimetype = MIMETYPES[variant]
+            # accept[mimetype] учитывает и более точные записи, например image/*, image/avif;q=0
+            if variant != base_extension and mimetype in listed and accept[mimetype] > best_quality:
+                best, best_quality = variant, accept[mimetype]
+        return best
+    
+    def send_thumbnail(file_id):
+        """Превью в лучшем формате по Accept: готовый вариант или (для старых загрузок) перекодированный в кэше"""
+        entry = image_index.get(file_id)
+        if not entry or not entry.get('thumbnail'):
+            return None
+        
+        variant = negotiate_variant(entry['thumbnail'].rsplit('.', 1)[-1])
+        if not variant:
+            return send_image(file_id, 'thumbnail')
+        if entry.get(f"thumbnail_{variant}"):
+            return send_image(file_id, f"thumbnail_{variant}")
+        
+        thumbnail_hash = image_index.etag(file_id, 'thumbnail')
+        return send_cached_rendition(
+            f"{thumbnail_hash}_{variant}", variant, f"{thumbnail_hash}-{variant}",
+            lambda: transcode(read_stored(entry['thumbnail']), variant)
+        )
+    
+    def send_rendition(file_id, width):
+        """Превью заданной ширины (в лучшем формате по Accept), создается в кэше при первом запросе"""
+        entry = image_index.get(file_id)
+        # У старых загрузок оригинала может не быть - тогда уменьшаем сохраненное превью
+        source = 'original' if entry and entry.get('original') else 'thumbnail'
+        if not entry or not entry.get(source):
+            return None
+        
+        source_hash = image_index.etag(file_id, source)
+        source_extension = entry[source].rsplit('.', 1)[-1]
+        variant = negotiate_variant(source_extension)
+        suffix = f"-{variant}" if variant else ''
+        return send_cached_rendition(
+            f"{source_hash}_w{width}", variant or source_extension, f"{source_hash}-w{width}{suffix}",
+            lambda: render_width(read_stored(entry[source]), width, variant)
+        )
+    
+    def cursor_arg(name):
+        """Курсор (sort_key, id) из query-параметра; ValueError, если он поврежден"""
+        value = request.args.get(name)
+        return decode_cursor(value, datetime, str) if value else None
+    
+    def account_profile_response(account, status=200, token=None, owner=False):
+        """Профиль со страницами bayed/posted (?bayed_after=, ?posted_after=).
 
-            # Сохраняем оригинал
-            original_path = os.path.join(app.config['UPLOAD_FOLDER'], original_filename)
-            
-            # Оптимизируем сохранение оригинала
-            if image.format == 'PNG':
-                image.save(original_path, optimize=True)
-            else:
-                image.save(original_path, optimize=True, quality=85)
+        Каждая коллекция - один запрос с LIMIT; курсоры следующих страниц отдаются
+        в заголовках X-Bayed-Next-Cursor и X-Posted-Next-Cursor. owner - профиль
+        запрашивает сам владелец: в posted видны и товары в processing/failed.
+        """
+        try:
+            bayed_after = cursor_arg('bayed_after')
+            posted_after = cursor_arg('posted_after')
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        limit = app.config['PROFILE_PRODUCTS_LIMIT']
+        purchases = db_manager.get_account_purchases(account.id, limit=limit, after=bayed_after)
+        posted = db_manager.get_user_products(account.id, limit=limit, after=posted_after, include_unready=owner)
+        
+        account_data = account.to_dict_with_products(purchases, posted)
+        if token:
+            account_data['token'] = token
+        response = jsonify(account_data)
+        response.status_code = status
+        if len(purchases) == limit:
+            response.headers['X-Bayed-Next-Cursor'] = encode_cursor(purchases[-1].purchased_at, purchases[-1].id)
+        if len(posted) == limit:
+            response.headers['X-Posted-Next-Cursor'] = encode_cursor(posted[-1].updated_at, posted[-1].id)
+        return response
+    
+    def auth_response(account, status=200):
+        """Ответ регистрации/входа: аккаунт и токен, коллекции - только по ?include=products"""
+        token = issue_token(account.id, app.config['SECRET_KEY'], app.config['TOKEN_TTL'])
+        if request.args.get('include') == 'products':
+            return account_profile_response(account, status, token, owner=True)
+        
+        account_data = account.to_dict()
+        account_data['token'] = token
+        return jsonify(account_data), status
+    
+    def cached_json_response(key, build):
+        """Ответ из кэша каталога или build() -> Response (в кэш попадают только 200).
 
-            # 🔥 СОЗДАЕМ ПРЕВЬЮ С ДИНАМИЧЕСКИМ РАЗМЕРОМ
-            thumbnail_image = image.copy()
-            thumbnail_image.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-            
-            thumbnail_path = os.path.join(app.config['UPLOAD_FOLDER'], 'thumbnails', thumbnail_filename)
-            
-            # Сохраняем превью с тем же форматом что и оригинал
-            if thumbnail_image.format == 'PNG':
-                thumbnail_image.save(thumbnail_path, optimize=True)
-            else:
-                if thumbnail_image.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', thumbnail_image.size, (255, 255, 255))
-                    background.paste(thumbnail_image, mask=thumbnail_image.split()[-1] if thumbnail_image.mode == 'RGBA' else None)
-                    thumbnail_image = background
-                thumbnail_image.save(thumbnail_path, optimize=True, quality=80)
-            
-            # Очищаем память
-            image.close()
-            thumbnail_image.close()
-            
-            processing_time = time.time() - start_time
-            if processing_time > 10:
-                print(f"Long image processing: {processing_time:.2f}s, size: {width}x{height}")
-            
-            return {
-                'original': original_filename,
-                'thumbnail': thumbnail_filename,
-                'file_id': file_id
-            }, None
-            
-        except Exception as e:
-            return None, f"Image processing error: {str(e)}"
+        Вместе с телом сохраняются заголовки X-*, например X-Next-Cursor.
+        """
+        cached = response_cache.get(key)
+        if cached:
+            body, headers = cached
+            response = app.response_class(body, mimetype='application/json')
+            response.headers.update(headers)
+            response.headers['X-Cache'] = 'HIT'
+            return response
+        
+        response = build()
+        if response.status_code == 200:
+            headers = {name: value for name, value in response.headers.items() if name.startswith('X-')}
+            response_cache.set(key, response.get_data(as_text=True), headers)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    
+    def json_bytes_response(data):
+        """Аналог jsonify через serializers.dumps (orjson, если установлен)"""
+        indent = app.json.compact is False or (app.json.compact is None and app.debug)
+        return app.response_class(serializers.dumps(data, indent), mimetype='application/json')
     
     def get_json_data():
         """Безопасное получение JSON данных из запроса"""
@@ -158,27 +340,38 @@ def create_app():
             except:
                 return {}
 
+    def request_token():
+        """Bearer-токен из заголовка Authorization или None"""
+        auth_header = request.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            return auth_header.split(' ')[1]
+        return None
+    
+    def token_account_id(token):
+        """ID аккаунта по токену или None, если токен неверный"""
+        # Подписанный токен проверяется по HMAC без обращения к базе
+        account_id = verify_token(token, app.config['SECRET_KEY'])
+        
+        # Переходный период: старые токены (ID аккаунта) проверяем через кэш аккаунтов
+        if account_id is None and datetime.now(timezone.utc) < app.config['LEGACY_TOKENS_UNTIL']:
+            account = db_manager.get_account_cached(token)
+            if account:
+                account_id = account.id
+        return account_id
+
     def token_required(f):
         """Декоратор для проверки токена"""
         @wraps(f)
         def decorated(*args, **kwargs):
-            token = None
-            
-            # Проверяем заголовок Authorization
-            auth_header = request.headers.get('Authorization')
-            if auth_header and auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-            
+            token = request_token()
             if not token:
                 return jsonify({'error': 'Token is missing'}), 401
             
-            # В реальном приложении здесь была бы проверка токена
-            # Для простоты используем ID аккаунта как токен
-            account = db_manager.get_account_by_id(token)
-            if not account:
+            account_id = token_account_id(token)
+            if account_id is None:
                 return jsonify({'error': 'Invalid token'}), 401
             
-            return f(account, *args, **kwargs)
+            return f(account_id, *args, **kwargs)
         
         return decorated
     
@@ -206,9 +399,15 @@ def create_app():
             'status': 'healthy', 
             'message': 'RikoaTech ArtMarket API is running',
             'timestamp': datetime.now(timezone.utc).isoformat(),
-            'version': '3.0'
+            'version': '3.0',
+            'responseCache': response_cache.stats()
         })
 
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
     # Authentication routes - изменены пути
     @app.route('/api/auth/register', methods=['POST'])
     def register():
@@ -222,12 +421,12 @@ def create_app():
                 mail=data['mail'],
                 password=data['password']
             )
-            # Добавляем токен в ответ (используем ID как токен для простоты)
-            account_data = account.to_dict_with_products()
-            account_data['token'] = account.id
-            return jsonify(account_data), 201
+            # Добавляем токен в ответ
+            return auth_response(account, 201)
         except ValueError as e:
             return jsonify({'error': str(e)}), 400
+        except HasherBusy:
+            return jsonify({'error': 'Too many authentication requests, try again later'}), 503
         except Exception as e:
             return jsonify({'error': 'Registration failed'}), 500
     
@@ -237,24 +436,29 @@ def create_app():
         if not data or not all(k in data for k in ['login', 'password']):
             return jsonify({'error': 'Missing login or password'}), 400
         
-        account = db_manager.get_account_by_credentials(
-            nickname=data['login'],  # используем login как nickname
-            password=data['password']
-        )
+        try:
+            account = db_manager.get_account_by_credentials(
+                nickname=data['login'],  # используем login как nickname
+                password=data['password']
+            )
+        except HasherBusy:
+            return jsonify({'error': 'Too many authentication requests, try again later'}), 503
         
         if account:
             # Добавляем токен в ответ
-            account_data = account.to_dict_with_products()
-            account_data['token'] = account.id
-            return jsonify(account_data)
+            return auth_response(account)
         else:
             return jsonify({'error': 'Invalid credentials'}), 401
 
     @app.route('/api/auth/profile', methods=['GET'])
     @token_required
-    def get_profile(current_account):
+    def get_profile(account_id):
         """Получить информацию о профиле по токену"""
-        return jsonify(current_account.to_dict_with_products())
+        account = db_manager.get_account_cached(account_id)
+        if not account:
+            return jsonify({'error': 'Account not found'}), 404
+        
+        return account_profile_response(account, owner=True)
 
     # Product routes - изменены пути и лимиты
     @app.route('/api/product', methods=['GET'])
@@ -262,35 +466,128 @@ def create_app():
         page = request.args.get('page', 1, type=int)
         per_page = 6  # 🔄 ФИКСИРОВАННО 6 штук
         
-        pagination = db_manager.get_products_paginated(page=page, per_page=per_page)
+        sort = request.args.get('sort', 'recent')
+        if sort not in FEED_SORTS:
+            return jsonify({'error': f"Invalid sort (allowed: {', '.join(FEED_SORTS)})"}), 400
+        filters = {'sort': sort, 'creator_id': request.args.get('creator') or None}
+        for name in ('min_price', 'max_price'):
+            value = request.args.get(name)
+            if value is None:
+                continue
+            try:
+                filters[name] = int(value)
+            except ValueError:
+                return jsonify({'error': f"{name} must be an integer"}), 400
+        
+        # Курсорный режим (?after=...) - стабильные страницы без OFFSET
+        after = request.args.get('after')
+        if after:
+            try:
+                after = decode_cursor(after, FEED_SORTS[sort][2], str)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        else:
+            after = None
         
-        return jsonify([product.to_dict() for product in pagination.items])
+        def build():
+            # Кортежи колонок сразу в JSON, без ORM-объектов (формат как у Product.to_dict)
+            rows = db_manager.get_feed_rows(page=page, per_page=per_page, after=after, **filters)
+            response = json_bytes_response([serializers.feed_product(row) for row in rows])
+            if len(rows) == per_page:
+                last = rows[-1]
+                response.headers['X-Next-Cursor'] = encode_cursor(getattr(last, FEED_SORTS[sort][0].key), last.id)
+            return response
+        
+        # Курсор уже привязан к sort (тип ключа), но фильтры входят в ключ кэша явно
+        params = [filters.get(name, '') for name in ('sort', 'creator_id', 'min_price', 'max_price')]
+        popular = sort == 'popular'
+        if after:
+            key = response_cache.feed_key('after', request.args['after'], *params, popular=popular)
+        else:
+            key = response_cache.feed_key('page', page, *params, popular=popular)
+        return cached_json_response(key, build)
+
+    @app.route('/api/product/search', methods=['GET'])
+    def search_products():
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+        if len(query) > app.config['SEARCH_QUERY_MAX_LENGTH']:
+            return jsonify({'error': 'Search query is too long'}), 400
+        per_page = 6
+        
+        after = request.args.get('after')
+        if after:
+            try:
+                # Второй элемент - rowid индекса FTS5 (SQLite) или id товара (другие СУБД)
+                after = decode_cursor(after, float, (int, str))
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        else:
+            after = None
+        
+        def build():
+            rows = db_manager.search_product_rows(query, limit=per_page, after=after)
+            response = json_bytes_response([serializers.feed_product(row) for row in rows])
+            if len(rows) == per_page:
+                response.headers['X-Next-Cursor'] = encode_cursor(rows[-1].rank, rows[-1].search_key)
+            return response
+        
+        # Ключ ленты: результаты сбрасываются вместе с ней при изменении товаров
+        return cached_json_response(response_cache.feed_key('search', request.args.get('after', ''), query), build)
 
     @app.route('/api/product/<product_id>/buyers', methods=['GET'])
     def get_product_buyers(product_id):
-        buyers = db_manager.get_product_buyers(product_id)
-        # 🔄 Ограничиваем 6 пользователями
-        limited_buyers = buyers[:6]
-        return jsonify([buyer.to_dict() for buyer in limited_buyers])
+        def build():
+            # 🔄 Ограничиваем 6 пользователями (LIMIT в SQL)
+            buyers = db_manager.get_product_buyer_rows(product_id, limit=app.config['BUYERS_LIMIT'])
+            return json_bytes_response([serializers.public_account(row) for row in buyers])
+        
+        return cached_json_response(response_cache.buyers_key(product_id), build)
 
     # 🔄 НОВЫЙ РОУТ ДЛЯ ПОКУПКИ
     @app.route('/api/product/buy', methods=['POST'])
     @token_required
-    def purchase_product(current_account):
+    def purchase_product(account_id):
         data = get_json_data()
-        if not data or 'id' not in data:
+        if not data or not ('id' in data or 'ids' in data):
             return jsonify({'error': 'Missing product id'}), 400
         
-        product_id = data['id']
-        product = db_manager.get_product(product_id)
-        if not product:
-            return jsonify({'error': 'Product not found'}), 404
+        # Корзина: {"ids": [...]} - все товары одной транзакцией, результат по каждому
+        if 'ids' in data:
+            product_ids = data['ids']
+            if not isinstance(product_ids, list) or not product_ids \
+                    or not all(isinstance(product_id, str) for product_id in product_ids):
+                return jsonify({'error': 'ids must be a non-empty list of product ids'}), 400
+            if len(product_ids) > app.config['CHECKOUT_MAX_ITEMS']:
+                return jsonify({'error': f"Too many items (max {app.config['CHECKOUT_MAX_ITEMS']})"}), 400
+            
+            try:
+                results = db_manager.create_purchases(account_id, product_ids)
+            except Exception:
+                app.logger.exception("Checkout failed for account %s", account_id)
+                return jsonify({'error': 'Failed to process purchase'}), 500
+            
+            items = []
+            for product_id, (purchase, status) in results.items():
+                item = {'id': product_id, 'status': status}
+                if purchase:
+                    item['purchase'] = purchase.to_dict()
+                items.append(item)
+            return jsonify({'success': True, 'results': items})
         
+        product_id = data['id']
+        if not isinstance(product_id, str):
+            return jsonify({'error': 'id must be a product id string'}), 400
         try:
-            purchase = db_manager.create_purchase(current_account.id, product_id)
-            return jsonify({'success': True, 'purchase': purchase.to_dict()}), 201
-        except Exception as e:
+            purchase, status = db_manager.create_purchases(account_id, [product_id])[product_id]
+        except Exception:
+            app.logger.exception("Purchase of %s failed for account %s", product_id, account_id)
             return jsonify({'error': 'Failed to process purchase'}), 500
+        
+        if status == db_manager.PURCHASE_NOT_FOUND:
+            return jsonify({'error': 'Product not found'}), 404
+        return jsonify({'success': True, 'purchase': purchase.to_dict()}), 201
 
     # Image serving routes - изменен путь
     @app.route('/photos/<file_id>')
@@ -303,11 +600,10 @@ def create_app():
                 return jsonify({'error': 'Product not found'}), 404
             
             # Ищем оригинальное изображение
-            uploads_dir = app.config['UPLOAD_FOLDER']
-            for filename in os.listdir(uploads_dir):
-                if filename.startswith(f"{product.photo_url}_original."):
-                    file_path = os.path.join(uploads_dir, filename)
-                    return send_file(file_path)
+            response = send_image(product.photo_url, 'original',
+                                  max_age=app.config['PRODUCT_PHOTO_MAX_AGE'], immutable=False)
+            if response:
+                return response
             
             return jsonify({'error': 'Image not found'}), 404
         except Exception as e:
@@ -344,66 +640,153 @@ def create_app():
                 return jsonify({'error': 'Price must be a number'}), 400
             
             # Verify creator exists
-            creator = db_manager.get_account_by_id(creator_id)
+            creator = db_manager.get_account_cached(creator_id)
             if not creator:
                 return jsonify({'error': 'Creator not found'}), 404
             
-            # Обрабатываем загруженное изображение
-            image_info, error = process_uploaded_image_with_timeout(file, timeout=app.config['MAX_PROCESSING_TIME'])
+            data, error = read_uploaded_image(file)
             if error:
                 return jsonify({'error': f'Image processing failed: {error}'}), 400
             
-            # Создаем продукт
+            # file_id - хэш содержимого: уже обработанный файл не декодируется заново
+            file_id = content_hash(data)
+            existing = image_index.get(file_id)
+            if existing and existing.get('original') and existing.get('thumbnail'):
+                product = db_manager.create_product(
+                    photo_url=file_id,
+                    creator_id=creator_id,
+                    title=title,
+                    price=price,
+                    description=description
+                )
+                return jsonify(product.to_dict()), 201
+            
+            # Формат и размеры проверяем по заголовку сразу, чтобы не ставить в очередь мусор
+            _, error = inspect_image(data, app.config['MAX_IMAGE_DIMENSION'], app.config['MAX_IMAGE_PIXELS'])
+            if error:
+                return jsonify({'error': f'Image processing failed: {error}'}), 400
+            
+            job_args = (data, file_id, storage, app.config['MAX_IMAGE_DIMENSION'],
+                        app.config['MAX_IMAGE_PIXELS'], app.config['REENCODE_ORIGINALS'])
+            
+            if image_jobs is None:
+                # IMAGE_WORKERS = 0: обработка прямо в запросе
+                image_info, error = process_image(*job_args)
+                metrics.record_upload(image_info, error)
+                if error:
+                    return jsonify({'error': f'Image processing failed: {error}'}), 400
+                image_index.register(image_info)
+                product = db_manager.create_product(
+                    photo_url=file_id,
+                    creator_id=creator_id,
+                    title=title,
+                    price=price,
+                    description=description
+                )
+                return jsonify(product.to_dict()), 201
+            
+            if image_jobs.is_full():
+                return jsonify({'error': 'Image processing queue is full, try again later'}), 503
+            
+            # Создаем продукт в состоянии processing, изображение обработает пул процессов
             product = db_manager.create_product(
-                photo_url=image_info['file_id'],
+                photo_url=file_id,
                 creator_id=creator_id,
                 title=title,
                 price=price,
-                description=description
+                description=description,
+                status=Product.STATUS_PROCESSING
             )
-            
-            return jsonify(product.to_dict()), 201
+            try:
+                image_jobs.submit(process_image, job_args, finish_image_job(product.id))
+            except QueueFull:
+                db_manager.set_product_status(product.id, Product.STATUS_FAILED, 'Image processing queue is full')
+                return jsonify({'error': 'Image processing queue is full, try again later'}), 503
+            
+            status_url = f"/api/products/{product.id}/status"
+            product_data = product.to_dict()
+            product_data['status'] = product.status
+            product_data['statusUrl'] = status_url
+            response = jsonify(product_data)
+            response.status_code = 202
+            response.headers['Location'] = status_url
+            return response
             
         else:
             return jsonify({'error': 'Please use form-data for image upload'}), 400
 
     @app.route('/api/products/<product_id>', methods=['GET'])
     def get_product_detail(product_id):
+        def build():
+            product = db_manager.get_product(product_id)
+            if not product or product.status != Product.STATUS_READY:
+                response = jsonify({'error': 'Product not found'})
+                response.status_code = 404
+                return response
+            
+            buyers = db_manager.get_product_buyers(product_id, limit=app.config['BUYERS_LIMIT'])
+            return jsonify(product.to_dict_with_buyers(buyers))
+        
+        response = cached_json_response(response_cache.product_key(product_id), build)
+        
+        # Товар в processing/failed виден только автору (по токену) и мимо кэша каталога
+        token = request_token()
+        if response.status_code == 404 and token:
+            product = db_manager.get_product(product_id)
+            if product and product.creator_id == token_account_id(token):
+                product_data = product.to_dict_with_buyers([])
+                product_data.update(product.to_status_dict())
+                return jsonify(product_data)
+        return response
+
+    @app.route('/api/products/<product_id>/status', methods=['GET'])
+    def get_product_status(product_id):
+        """Состояние фоновой обработки изображения товара"""
         product = db_manager.get_product(product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        return jsonify(product.to_dict_with_buyers())
+        return jsonify(product.to_status_dict())
 
     @app.route('/api/accounts/<account_id>', methods=['GET'])
     def get_account(account_id):
-        account = db_manager.get_account_by_id(account_id)
+        account = db_manager.get_account_cached(account_id)
         if not account:
             return jsonify({'error': 'Account not found'}), 404
         
-        return jsonify(account.to_dict_with_products())
+        return account_profile_response(account)
 
     # Вспомогательные роуты для изображений (для обратной совместимости)
     @app.route('/api/images/original/<file_id>')
     def serve_original_image(file_id):
         """Отдает оригинальное изображение по ID"""
         try:
-            uploads_dir = app.config['UPLOAD_FOLDER']
-            for filename in os.listdir(uploads_dir):
-                if filename.startswith(f"{file_id}_original."):
-                    file_path = os.path.join(uploads_dir, filename)
-                    return send_file(file_path)
+            response = send_image(file_id, 'original')
+            if response:
+                return response
             return jsonify({'error': 'Original image not found'}), 404
         except Exception as e:
             return jsonify({'error': 'Image not found'}), 404
 
     @app.route('/api/images/thumbnail/<file_id>')
     def serve_thumbnail_image(file_id):
-        """Отдает превью изображения по ID"""
+        """Отдает превью изображения по ID (?w= - превью заданной ширины)"""
+        width = None
+        if 'w' in request.args:
+            width = request.args.get('w', type=int)
+            if width not in app.config['THUMBNAIL_WIDTHS']:
+                widths = ', '.join(str(w) for w in app.config['THUMBNAIL_WIDTHS'])
+                return jsonify({'error': f'Unsupported width, use one of: {widths}'}), 400
+        
         try:
-            thumbnail_path = os.path.join(app.config['UPLOAD_FOLDER'], 'thumbnails', f"{file_id}_thumbnail.jpeg")
-            if os.path.exists(thumbnail_path):
-                return send_file(thumbnail_path)
+            if width:
+                response = send_rendition(file_id, width)
+            else:
+                response = send_thumbnail(file_id)
+            if response:
+                # Содержимое зависит от Accept - кэши должны это учитывать
+                response.vary.add('Accept')
+                return response
             else:
                 return jsonify({'error': 'Thumbnail not found'}), 404
         except Exception as e: